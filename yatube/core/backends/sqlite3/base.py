@@ -0,0 +1,30 @@
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с настраиваемым режимом транзакций.
+
+    OPTIONS['transaction_mode'] (как в Django 5.1): с IMMEDIATE
+    транзакция сразу берёт блокировку записи и ждёт её busy_timeout.
+    В режиме по умолчанию транзакция, начавшая с чтения, при первой
+    записи получает «database is locked» без ожидания, если другой
+    процесс уже пишет.
+    """
+    transaction_mode = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        mode = params.pop('transaction_mode', None)
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ValueError(
+                f'Неизвестный transaction_mode для SQLite: {mode}'
+            )
+        self.transaction_mode = mode.upper() if mode else None
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            return super()._start_transaction_under_autocommit()
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,165 @@
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_missing = object()
+_lock = threading.Lock()
+_add_lock = threading.Lock()
+_stats = defaultdict(lambda: defaultdict(int))
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кеш: LRU в памяти процесса перед общим кешем.
+
+    Общий уровень - другой псевдоним из CACHES (OPTIONS['SHARED']), его
+    видят все воркеры. Локальный уровень - LocMemCache на
+    LOCAL_MAX_ENTRIES записей, каждая живёт не дольше LOCAL_TIMEOUT
+    секунд: запись и удаление в этом процессе сразу меняют оба уровня,
+    а в остальных процессах локальная копия устаревает не дольше чем на
+    LOCAL_TIMEOUT. Ключи с префиксами из LOCAL_EXCLUDE (например, версии
+    содержимого) читаются только из общего кеша, поэтому инвалидация
+    по версиям видна всем процессам сразу.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.name = location or 'tiered'
+        self.shared_alias = options['SHARED']
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.local_exclude = tuple(options.get('LOCAL_EXCLUDE', ()))
+        self.local = LocMemCache(f'tiered:{self.name}', {
+            'TIMEOUT': self.local_timeout,
+            'OPTIONS': {
+                'MAX_ENTRIES': options.get('LOCAL_MAX_ENTRIES', 1000),
+            },
+        })
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _count(self, tier, event, number=1):
+        with _lock:
+            _stats[(self.name, tier)][event] += number
+
+    def _is_local(self, key):
+        return not key.startswith(self.local_exclude)
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _set_local(self, key, value, timeout, version):
+        if not self._is_local(key):
+            return
+        local_timeout = self._local_timeout(timeout)
+        if local_timeout > 0:
+            self.local.set(key, value, local_timeout, version)
+        else:
+            self.local.delete(key, version)
+
+    def get(self, key, default=None, version=None):
+        if self._is_local(key):
+            value = self.local.get(key, _missing, version)
+            if value is not _missing:
+                self._count('local', 'hits')
+                return value
+            self._count('local', 'misses')
+        value = self.shared.get(key, _missing, version)
+        if value is _missing:
+            self._count('shared', 'misses')
+            return default
+        self._count('shared', 'hits')
+        self._set_local(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        local_keys = [key for key in keys if self._is_local(key)]
+        found = self.local.get_many(local_keys, version)
+        self._count('local', 'hits', len(found))
+        self._count('local', 'misses', len(local_keys) - len(found))
+        rest = [key for key in keys if key not in found]
+        if rest:
+            shared = self.shared.get_many(rest, version)
+            self._count('shared', 'hits', len(shared))
+            self._count('shared', 'misses', len(rest) - len(shared))
+            for key, value in shared.items():
+                self._set_local(key, value, DEFAULT_TIMEOUT, version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self._set_local(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._set_local(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # add() служит блокировкой, а у файлового кеша он не атомарен:
+        # внутри процесса потоки проходят его по одному
+        with _add_lock:
+            added = self.shared.add(key, value, timeout, version)
+        if added:
+            self._set_local(key, value, timeout, version)
+        else:
+            self.local.delete(key, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        self.local.delete(key, version)
+        return value
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self.local.has_key(key, version):
+            return True
+        return self.shared.has_key(key, version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version)
+        self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        self.local.delete_many(keys, version)
+        self.shared.delete_many(keys, version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def tier_stats(self):
+        """Попадания и промахи каждого уровня в этом процессе."""
+        with _lock:
+            tiers = {
+                tier: dict(_stats[(self.name, tier)])
+                for tier in ('local', 'shared')
+            }
+        for counters in tiers.values():
+            hits = counters.setdefault('hits', 0)
+            total = hits + counters.setdefault('misses', 0)
+            counters['hit_ratio'] = round(hits / total, 3) if total else None
+        tiers['local']['entries'] = len(self.local._cache)
+        return tiers
+
+
+def cache_stats():
+    """Статистика уровней всех двухуровневых кешей из CACHES."""
+    return {
+        alias: caches[alias].tier_stats()
+        for alias in settings.CACHES
+        if isinstance(caches[alias], TieredCache)
+    }
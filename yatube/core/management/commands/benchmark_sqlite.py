@@ -0,0 +1,222 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.management.commands.benchmark_views import (
+    milliseconds, percentile,
+)
+from posts.models import Post, User
+
+# Воркеры запускаются начисто (spawn) и не наследуют соединения и
+# транзакции родителя; Django в них настраивается до импорта команды
+STARTUP_SECONDS = 5
+# Профили сравниваются на копиях одной и той же базы. baseline - SQLite
+# «из коробки»: журнал отката, отложенные транзакции, таймаут Python.
+PROFILES = {
+    'baseline': {
+        'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+        'transaction_mode': None,
+    },
+    'tuned': {
+        'pragmas': None,
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+BENCH_USERNAME = 'benchmark'
+
+
+def _use_database(name, profile):
+    """Настраивает соединение процесса-воркера на базу и профиль."""
+    connections['default'].close()
+    database = connections['default'].settings_dict
+    database['NAME'] = name
+    database['OPTIONS'] = {
+        key: value for key, value in database['OPTIONS'].items()
+        if key != 'transaction_mode'
+    }
+    if profile['transaction_mode']:
+        database['OPTIONS']['transaction_mode'] = profile['transaction_mode']
+    if profile['pragmas'] is not None:
+        settings.SQLITE_PRAGMAS = profile['pragmas']
+
+
+def _build(task):
+    """Создаёт шаблонную базу: схема и синтетические данные."""
+    name, options = task
+    _use_database(name, PROFILES['baseline'])
+    call_command('migrate', verbosity=0)
+    call_command(
+        'seed_posts',
+        users=options['users'],
+        groups=options['groups'],
+        posts=options['posts'],
+        comments=options['comments'],
+        images=0,
+        random_seed=options['random_seed'],
+        stdout=StringIO(),
+    )
+    connections.close_all()
+
+
+def _work(task):
+    """Один «WSGI-воркер»: чтения и записи через Client до дедлайна."""
+    name, profile, options, number, started = task
+    _use_database(name, PROFILES[profile])
+    rnd = random.Random(options['random_seed'] + number)
+    post_ids = list(Post.objects.values_list('pk', flat=True)[:1000])
+    user, _ = User.objects.get_or_create(
+        username=f'{BENCH_USERNAME}{number}'
+    )
+    guest, member = Client(), Client()
+    member.force_login(user)
+    timings = {'read': [], 'write': []}
+    errors = 0
+    # Все воркеры начинают и заканчивают одновременно
+    time.sleep(max(0, started - time.time()))
+    while time.time() < started + options['duration']:
+        write = rnd.random() < options['write_ratio']
+        post_id = rnd.choice(post_ids)
+        start = time.perf_counter()
+        try:
+            if not write:
+                response = guest.get(
+                    reverse('posts:post_detail', args=[post_id])
+                )
+            elif rnd.random() < 0.5:
+                response = member.post(
+                    reverse('posts:add_comment', args=[post_id]),
+                    {'text': 'Комментарий под нагрузкой'},
+                )
+            else:
+                response = member.post(
+                    reverse('posts:post_create'),
+                    {'text': 'Пост под нагрузкой'},
+                )
+            failed = response.status_code >= 500
+        except DatabaseError:
+            failed = True
+        elapsed = time.perf_counter() - start
+        if failed:
+            errors += 1
+        else:
+            timings['write' if write else 'read'].append(elapsed)
+    connections.close_all()
+    return timings, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite при параллельных '
+        'чтениях и записях из нескольких процессов: настройки по '
+        'умолчанию (baseline) против SQLITE_PRAGMAS и BEGIN IMMEDIATE '
+        '(tuned). Работает на временной базе и пишет отчёт в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Число процессов, как число воркеров WSGI-сервера',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность замера каждого профиля, секунды',
+        )
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='Доля запросов на запись (комментарии и посты)',
+        )
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument(
+            '--profiles', default=','.join(PROFILES),
+            help='Профили через запятую',
+        )
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Файл для JSON, по умолчанию stdout',
+        )
+
+    def handle(self, *args, **options):
+        profiles = [name for name in options['profiles'].split(',') if name]
+        for name in profiles:
+            if name not in PROFILES:
+                raise ValueError(f'Неизвестный профиль: {name}')
+        context = multiprocessing.get_context('spawn')
+        directory = tempfile.mkdtemp(prefix='benchmark_sqlite_')
+        try:
+            template = os.path.join(directory, 'template.sqlite3')
+            self.stderr.write('Подготовка базы...')
+            with context.Pool(1, initializer=django.setup) as pool:
+                pool.map(_build, [(template, options)])
+            results = {}
+            for profile in profiles:
+                name = os.path.join(directory, f'{profile}.sqlite3')
+                shutil.copyfile(template, name)
+                self.stderr.write(f'Замер профиля {profile}...')
+                results[profile] = self.measure(
+                    context, name, profile, options
+                )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'options': {
+                name: options[name]
+                for name in (
+                    'workers', 'duration', 'write_ratio', 'posts',
+                    'comments', 'random_seed',
+                )
+            },
+            'results': results,
+        }
+        if 'baseline' in results and 'tuned' in results:
+            baseline = results['baseline']['throughput_rps']
+            report['speedup'] = round(
+                results['tuned']['throughput_rps'] / baseline, 2
+            ) if baseline else None
+        report = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
+
+    def measure(self, context, name, profile, options):
+        workers = max(1, options['workers'])
+        with context.Pool(workers, initializer=django.setup) as pool:
+            started = time.time() + STARTUP_SECONDS
+            tasks = [
+                (name, profile, options, number, started)
+                for number in range(workers)
+            ]
+            outcomes = pool.map(_work, tasks)
+        result = {'errors': sum(errors for _, errors in outcomes)}
+        total = 0
+        for kind in ('read', 'write'):
+            timings = sorted(
+                value for worker, _ in outcomes for value in worker[kind]
+            )
+            total += len(timings)
+            result[kind] = {
+                'requests': len(timings),
+                'p50_ms': milliseconds(percentile(timings, 50) or 0),
+                'p99_ms': milliseconds(percentile(timings, 99) or 0),
+            }
+        result['throughput_rps'] = round(total / options['duration'], 2)
+        return result
@@ -0,0 +1,90 @@
+import json
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import routers, stats
+
+logger = logging.getLogger('core.stats')
+
+PRIMARY_COOKIE = 'read_primary'
+
+
+class ViewStatsMiddleware:
+    """Замеряет число SQL-запросов, время в базе, шаблонах и общее.
+
+    Замеры каждого запроса пишутся строкой JSON в лог core.stats
+    (уровень INFO) и копятся по представлениям для /stats/views/.
+    Превышение VIEW_QUERY_BUDGETS пишется в лог как предупреждение.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_stats = stats.start_request()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(
+                            request_stats.execute_wrapper
+                        )
+                    )
+                response = self.get_response(request)
+        finally:
+            stats.finish_request()
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        data = request_stats.as_dict()
+        budget = settings.VIEW_QUERY_BUDGETS.get(match.view_name)
+        over_budget = budget is not None and data['queries'] > budget
+        stats.record(match.view_name, data, over_budget)
+        line = json.dumps(
+            dict(view=match.view_name, status=response.status_code, **data)
+        )
+        logger.info(line)
+        if over_budget:
+            logger.warning(
+                'Превышен бюджет запросов %s: %s', budget, line
+            )
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Направляет чтения представлений с read_replica на реплики.
+
+    Запрос, который что-то записал, ставит cookie на
+    REPLICA_STICKY_SECONDS: пока она жива, пользователь читает из
+    основной базы и видит свои изменения, даже если реплики отстают.
+    Стоит до SessionMiddleware, чтобы замечать и запись сессии.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.start_tracking()
+        request.replica_reads = ExitStack()
+        with request.replica_reads:
+            response = self.get_response(request)
+        if routers.has_written():
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            getattr(view_func, 'read_replica', False)
+            and request.method in ('GET', 'HEAD')
+            and PRIMARY_COOKIE not in request.COOKIES
+        ):
+            request.replica_reads.enter_context(routers.use_replica())
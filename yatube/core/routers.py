@@ -0,0 +1,71 @@
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+_state = threading.local()
+
+
+def read_replica(view_func):
+    """Помечает представление: его GET-запросы читают с реплик."""
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        return view_func(*args, **kwargs)
+    wrapper.read_replica = True
+    return wrapper
+
+
+@contextmanager
+def use_replica():
+    """Чтения внутри блока идут на реплику (если реплики настроены)."""
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def reading_replica():
+    """Идут ли сейчас чтения на реплику."""
+    return bool(
+        settings.DATABASE_REPLICAS and getattr(_state, 'replica', False)
+    )
+
+
+def start_tracking():
+    """Начинает учёт записей текущего запроса (см. has_written)."""
+    _state.written = False
+
+
+def has_written():
+    return getattr(_state, 'written', False)
+
+
+class ReplicaRouter:
+    """Чтения в помеченных блоках - на реплики, всё остальное - в default.
+
+    Реплики перечисляются в DATABASE_REPLICAS; пока список пуст, роутер
+    ничего не меняет. Любая запись отмечается, чтобы middleware могла
+    закрепить пользователя за основной базой.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _state.written = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
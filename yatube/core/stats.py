@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.template.backends.django import DjangoTemplates, Template
+
+_local = threading.local()
+_lock = threading.Lock()
+_views = defaultdict(lambda: defaultdict(float))
+
+
+class RequestStats:
+    """Счётчики одного запроса: SQL, время в базе и в шаблонах."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 3),
+            'template_ms': round(self.template_time * 1000, 3),
+            'total_ms': round(
+                (time.perf_counter() - self.started) * 1000, 3
+            ),
+        }
+
+
+def start_request():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def finish_request():
+    _local.stats = None
+
+
+def current():
+    return getattr(_local, 'stats', None)
+
+
+def record(view_name, data, over_budget):
+    """Добавляет замеры запроса в общую статистику представления."""
+    with _lock:
+        totals = _views[view_name]
+        totals['requests'] += 1
+        totals['over_budget'] += over_budget
+        for name, value in data.items():
+            totals[f'{name}_sum'] += value
+            totals[f'{name}_max'] = max(totals[f'{name}_max'], value)
+
+
+def snapshot():
+    """Статистика по представлениям: суммы, средние и максимумы."""
+    with _lock:
+        views = {name: dict(totals) for name, totals in _views.items()}
+    for totals in views.values():
+        for name in ('queries', 'db_ms', 'template_ms', 'total_ms'):
+            totals[f'{name}_avg'] = round(
+                totals[f'{name}_sum'] / totals['requests'], 3
+            )
+    return views
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current()
+        if stats is None:
+            return super().render(context, request)
+        # Вложенные render_to_string уже входят во внешний замер
+        stats.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django, замеряющий время отрисовки."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -0,0 +1,93 @@
+import hashlib
+import mimetypes
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Сколько байт файла хешируется за раз
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, которое называет файлы по их содержимому.
+
+    Имя файла - SHA-256 загруженного содержимого в каталоге upload_to,
+    разложенное по подкаталогам из первых двух символов хеша:
+    posts/ab/ab12...ef.jpg. Одинаковые файлы получают одно имя и
+    хранятся один раз; повторное сохранение только обновляет время
+    изменения существующего файла. Обработанную версию файла можно
+    записать под тем же именем (replace), тогда повторная загрузка того
+    же файла сразу получит обработанную версию. Удалять файл, на который
+    больше никто не ссылается, - забота вызывающего кода
+    (см. posts.images.release_image).
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Вызывается из _save, если файл появился между проверкой и
+        # записью: его только что сохранил другой запрос с тем же
+        # содержимым. Искать свободное имя не нужно.
+        raise FileExistsError(name)
+
+    def _hash(self, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return digest.hexdigest()
+
+    def _extension(self, name):
+        extension = os.path.splitext(name)[1].lower()
+        content_type, _ = mimetypes.guess_type(name)
+        if content_type is not None:
+            # .jpeg и .JPG - одно и то же
+            extension = mimetypes.guess_extension(content_type) or extension
+        return extension
+
+    def content_name(self, name, content):
+        """Имя, под которым хранится content, сохранённый как name."""
+        digest = self._hash(content)
+        return os.path.join(
+            os.path.dirname(name),
+            digest[:2],
+            f'{digest}{self._extension(name)}',
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        try:
+            if self.exists(name):
+                os.utime(self.path(name))
+                return name
+            try:
+                return self._save(name, content)
+            except FileExistsError:
+                return name
+        finally:
+            if hasattr(content, 'temporary_file_path'):
+                # Файл на диске перенесён (или не нужен), его открытый
+                # дескриптор больше ни к чему
+                content.close()
+
+    def replace(self, name, content):
+        """Заменяет содержимое файла name, не меняя имени.
+
+        Запись идёт во временный файл рядом, который затем атомарно
+        встаёт на место: читатели видят либо старый файл, либо новый.
+        """
+        path = self.path(name)
+        temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temporary, 'wb') as file:
+            for chunk in content.chunks():
+                file.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporary, self.file_permissions_mode)
+        os.replace(temporary, path)
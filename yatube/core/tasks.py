@@ -0,0 +1,58 @@
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_worker = None
+
+
+def _execute(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s упала', func.__name__)
+
+
+def _run():
+    while True:
+        func, args = _queue.get()
+        try:
+            _execute(func, args)
+        finally:
+            # У потока свои соединения с базой, держать их незачем
+            connections.close_all()
+            _queue.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_run, name='background-tasks', daemon=True
+            )
+            _worker.start()
+
+
+def enqueue(func, *args):
+    """Выполняет func(*args) в фоновом потоке процесса.
+
+    С BACKGROUND_TASKS_SYNC = True задача выполняется сразу,
+    это удобно в тестах и management-командах.
+    """
+    if settings.BACKGROUND_TASKS_SYNC:
+        _execute(func, args)
+        return
+    _queue.put((func, args))
+    _ensure_worker()
+
+
+def wait():
+    """Ждёт выполнения всех поставленных задач."""
+    _queue.join()
@@ -0,0 +1,219 @@
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test import (
+    Client, SimpleTestCase, TestCase, override_settings,
+)
+from django.urls import path, reverse
+
+from posts.cache import new_version, replica_safe
+from posts.models import Post
+
+from . import stats
+from .backends.sqlite3.base import DatabaseWrapper
+from .cache import TieredCache, cache_stats
+from .middleware import PRIMARY_COOKIE
+from .routers import ReplicaRouter, read_replica, use_replica
+
+User = get_user_model()
+
+
+class ViewStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.admin = User.objects.create_user(
+            username='admin', is_staff=True
+        )
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def test_view_stats_recorded(self):
+        """Замеры запросов копятся по имени представления."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        self.client.get(url)
+        view = stats.snapshot()['posts:post_detail']
+        self.assertEqual(view['requests'], 2)
+        self.assertGreater(view['queries_max'], 0)
+        self.assertGreater(view['template_ms_sum'], 0)
+        self.assertGreaterEqual(view['total_ms_max'], view['db_ms_max'])
+
+    @override_settings(VIEW_QUERY_BUDGETS={'posts:post_detail': 1})
+    def test_query_budget_warning(self):
+        """Превышение бюджета запросов пишется в лог."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with self.assertLogs('core.stats', 'WARNING') as logs:
+            self.client.get(url)
+        self.assertIn('posts:post_detail', logs.output[0])
+        self.assertEqual(
+            stats.snapshot()['posts:post_detail']['over_budget'], 1
+        )
+
+    def test_stats_endpoint(self):
+        """Статистика отдаётся в JSON только персоналу."""
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('view_stats'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('view_stats'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('posts:index', response.json()['views'])
+        self.assertIn('default', response.json()['cache'])
+
+
+class SqliteTuningTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.name = os.path.join(directory, 'tuning.sqlite3')
+
+    def make_connection(self, **options):
+        settings_dict = {
+            **connection.settings_dict,
+            'NAME': self.name,
+            'OPTIONS': options,
+        }
+        wrapper = DatabaseWrapper(settings_dict, alias='tuning')
+        connections['tuning'] = wrapper
+        self.addCleanup(connections.__delitem__, 'tuning')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    @override_settings(SQLITE_PRAGMAS={
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 1234,
+    })
+    def test_pragmas_applied_on_connect(self):
+        """Прагмы из настроек ставятся каждому новому соединению."""
+        with self.make_connection().cursor() as cursor:
+            for pragma, expected in (
+                ('journal_mode', 'wal'),
+                ('synchronous', 1),
+                ('busy_timeout', 1234),
+            ):
+                cursor.execute(f'PRAGMA {pragma}')
+                self.assertEqual(cursor.fetchone()[0], expected)
+
+    def test_immediate_transactions(self):
+        """Транзакции начинаются с BEGIN IMMEDIATE."""
+        wrapper = self.make_connection(transaction_mode='immediate')
+        wrapper.force_debug_cursor = True
+        with transaction.atomic(using='tuning'):
+            pass
+        self.assertEqual(wrapper.queries_log[-1]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_unknown_transaction_mode(self):
+        with self.assertRaises(ValueError):
+            self.make_connection(transaction_mode='lazy').cursor()
+
+
+@read_replica
+def replica_view(request):
+    return HttpResponse(router.db_for_read(Post))
+
+
+def write_view(request):
+    User.objects.filter(username='nobody').update(first_name='x')
+    return HttpResponse(router.db_for_read(Post))
+
+
+urlpatterns = [
+    path('replica/', replica_view),
+    path('write/', write_view),
+]
+
+
+@override_settings(ROOT_URLCONF='core.test', DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    def test_router(self):
+        """Чтения на реплику только в помеченном блоке, записи - в default."""
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'default')
+        with use_replica():
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_replica_views_and_stickiness(self):
+        """После записи пользователь читает из основной базы."""
+        self.assertEqual(self.client.get('/replica/').content, b'replica')
+        self.assertEqual(self.client.post('/replica/').content, b'default')
+        response = self.client.post('/write/')
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(self.client.get('/replica/').content, b'default')
+        self.client.cookies.pop(PRIMARY_COOKIE)
+        self.assertEqual(self.client.get('/replica/').content, b'replica')
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_fresh_versions_not_cached_from_replica(self):
+        """Страницы с реплики не кешируются сразу после смены версии."""
+        fresh, settled = new_version(), '1-settled'
+        self.assertTrue(replica_safe(fresh))
+        with use_replica():
+            self.assertFalse(replica_safe(fresh))
+            self.assertTrue(replica_safe(settled))
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        # Два «процесса» с общим уровнем и своими локальными
+        params = {'OPTIONS': {
+            'SHARED': 'shared', 'LOCAL_EXCLUDE': ('version:',),
+        }}
+        self.first = TieredCache('first', params)
+        self.second = TieredCache('second', params)
+        self.first.local.clear()
+        self.second.local.clear()
+
+    def test_local_tier_serves_repeated_reads(self):
+        """Повторное чтение идёт из памяти процесса."""
+        before = self.second.tier_stats()
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        caches['shared'].delete('key')
+        self.assertEqual(self.second.get('key'), 'value')
+        stats = self.second.tier_stats()
+        for tier in ('local', 'shared'):
+            self.assertEqual(
+                stats[tier]['hits'] - before[tier]['hits'], 1
+            )
+        self.assertIn('local', cache_stats()['default'])
+
+    def test_delete_invalidates_both_tiers(self):
+        self.first.set('key', 'value')
+        self.assertEqual(self.first.get('key'), 'value')
+        self.first.delete('key')
+        self.assertIsNone(self.first.get('key'))
+        self.assertIsNone(caches['shared'].get('key'))
+
+    def test_excluded_keys_read_from_shared_tier(self):
+        """Версии видны всем процессам сразу после записи."""
+        self.first.set('version:index', 1)
+        self.assertEqual(self.second.get('version:index'), 1)
+        self.first.set('version:index', 2)
+        self.assertEqual(self.second.get('version:index'), 2)
+        self.assertEqual(len(self.second.local._cache), 0)
+
+    def test_local_copy_expires(self):
+        self.first.set('key', 'value', timeout=0)
+        self.assertFalse(self.first.local.has_key('key'))
+        self.first.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.second.get_many(['a', 'b', 'c']), {
+            'a': 1, 'b': 2,
+        })
+        self.assertEqual(self.second.local.get('a'), 1)
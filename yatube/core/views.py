@@ -1,5 +1,10 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from . import stats
+from .cache import cache_stats
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -9,3 +14,12 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def view_stats(request):
+    """Накопленная статистика представлений и кешей в JSON."""
+    return JsonResponse({
+        'views': stats.snapshot(),
+        'cache': cache_stats(),
+    })
@@ -1,21 +1,96 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 
-from .models import Group, Post
+from .models import Follow, Group, Post
+from .search import filter_posts
+from .utils import EstimatedCountPaginator
+
+
+class JoinedAutocompleteSelect(AutocompleteSelect):
+    """AutocompleteSelect, которому выбранный объект передаёт форма.
+
+    Стандартный виджет ищет выбранный объект отдельным запросом, то есть
+    по запросу на каждую строку редактируемого списка, хотя группа поста
+    уже загружена через list_select_related.
+    """
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = self.selected
+        if selected is None or [str(v) for v in value] != [str(selected.pk)]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name,
+            selected.pk,
+            self.choices.field.label_from_instance(selected),
+            True,
+            len(options),
+        ))
+        return [(None, options, 0)]
+
+
+class PostChangeListForm(forms.ModelForm):
+    """Форма строки списка: отдаёт виджетам уже загруженные объекты."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            widget = getattr(field.widget, 'widget', field.widget)
+            if isinstance(widget, JoinedAutocompleteSelect):
+                widget.selected = getattr(self.instance, name)
 
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group',)
     list_editable = ('group',)
+    # Автор и группа строк списка - одним JOIN, а не запросом на строку
+    list_select_related = ('author', 'group')
+    # Вместо <select> со всеми группами и пользователями в каждой строке
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    # Без точного COUNT(*) по всей таблице на каждой странице списка
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs.setdefault('widget', JoinedAutocompleteSelect(
+                db_field.remote_field,
+                self.admin_site,
+                using=kwargs.get('using'),
+            ))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', PostChangeListForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через полнотекстовый индекс, а не LIKE
+        if not search_term:
+            return queryset, False
+        return filter_posts(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'description',)
-    search_fields = ('text',)
+    search_fields = ('title', 'slug',)
     empty_value_display = '-пусто-'
 
 
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('user', 'author',)
+    list_select_related = ('user', 'author',)
+    raw_id_fields = ('user', 'author',)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
+admin.site.register(Follow, FollowAdmin)
@@ -0,0 +1,245 @@
+import hashlib
+import math
+import random
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_page
+
+from core import routers
+
+VERSION_KEY_PREFIX = 'posts_version'
+LOCK_KEY_PREFIX = 'posts_lock'
+# Как часто ждущие запросы проверяют, не появилось ли значение
+LOCK_POLL_INTERVAL = 0.05
+
+
+def version_key(*parts):
+    return ':'.join(str(part) for part in (VERSION_KEY_PREFIX,) + parts)
+
+
+def new_version():
+    return f'{int(time.time())}-{uuid.uuid4().hex}'
+
+
+def get_version(*parts):
+    """Текущая версия содержимого (например, главной страницы).
+
+    Версия - время создания и случайная строка, поэтому после потери
+    ключа или очистки кеша она не совпадёт ни с одной из прежних.
+    """
+    key = version_key(*parts)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*parts):
+    """Меняет версию: всё, что закешировано со старой, перестаёт читаться."""
+    cache.set(version_key(*parts), new_version(), None)
+
+
+def bump_version_on_commit(*parts):
+    """bump_version сразу и ещё раз после фиксации текущей транзакции.
+
+    Первая смена версии нужна чтениям в той же транзакции. Но до
+    фиксации другой процесс может прочитать под новой версией ещё
+    старые строки и закешировать их до конца срока - поэтому после
+    фиксации версия меняется снова. Вне транзакции версия меняется
+    сразу (дважды).
+    """
+    bump_version(*parts)
+    transaction.on_commit(lambda: bump_version(*parts))
+
+
+def replica_safe(*versions):
+    """Можно ли кешировать прочитанное сейчас под этими версиями.
+
+    Сразу после смены версии реплика может ещё не видеть изменений,
+    и закешированная с неё страница осталась бы устаревшей до
+    следующей смены. Поэтому первые REPLICA_STICKY_SECONDS после смены
+    страницы с реплик не кешируются.
+    """
+    if not routers.reading_replica():
+        return True
+    settled = time.time() - settings.REPLICA_STICKY_SECONDS
+    for version in versions:
+        created, _, _ = version.partition('-')
+        if created.isdigit() and int(created) > settled:
+            return False
+    return True
+
+
+def revalidate_in_browser(response):
+    """Браузер перепроверяет страницу при каждом показе (по ETag).
+
+    Срок серверного кеша не попадает в Cache-Control и Expires: иначе
+    браузер до конца этого срока показывал бы свою копию без новых
+    постов.
+    """
+    if response.has_header('Expires'):
+        del response['Expires']
+    patch_cache_control(response, private=True, max_age=0)
+    return response
+
+
+def versioned_cache_page(timeout, key_prefix, *parts):
+    """cache_page, ключ которого включает версию содержимого.
+
+    Страница живёт в кеше до timeout или до смены версии parts
+    (по умолчанию совпадают с key_prefix), смотря что наступит раньше.
+    """
+    parts = parts or (key_prefix,)
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            version = get_version(*parts)
+            if not replica_safe(version):
+                return view_func(request, *args, **kwargs)
+            prefix = f'{key_prefix}:{version}'
+            cached_view = cache_page(timeout, key_prefix=prefix)(view_func)
+            return revalidate_in_browser(
+                cached_view(request, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+
+def lock_key(key):
+    return f'{LOCK_KEY_PREFIX}:{key}'
+
+
+def _wait_for(key):
+    """Ждёт, пока значение key вычислит держатель блокировки."""
+    deadline = time.time() + settings.CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None or not cache.has_key(lock_key(key)):
+            return entry or cache.get(key)
+    return None
+
+
+def coalesced_get(key, compute, timeout, stale=0, beta=1.0, cacheable=None):
+    """Значение из кеша; при промахе compute() выполняет один запрос.
+
+    Защита от «лавины» промахов: вычисляет только тот, кто взял
+    блокировку (cache.add), остальные ждут результата. Значение
+    хранится ещё stale секунд после истечения timeout и всё это время
+    отдаётся, пока один запрос его обновляет. Обновление начинается и
+    чуть раньше срока с вероятностью, растущей к его концу и со временем
+    вычисления (XFetch, beta - его множитель). cacheable(value) решает,
+    можно ли сохранить результат.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        early = delta * beta * math.log(1 - random.random())
+        if time.time() - early < expires:
+            return value
+        if not cache.add(lock_key(key), 1, settings.CACHE_LOCK_TIMEOUT):
+            return value
+    elif not cache.add(lock_key(key), 1, settings.CACHE_LOCK_TIMEOUT):
+        entry = _wait_for(key)
+        if entry is not None:
+            return entry[0]
+        # Держатель блокировки не сохранил результат или не успел
+        return compute()
+    # Между промахом и блокировкой прежний держатель мог успеть
+    # сохранить свежее значение и отпустить блокировку
+    entry = cache.get(key)
+    if entry is not None and time.time() < entry[2]:
+        cache.delete(lock_key(key))
+        return entry[0]
+    try:
+        started = time.time()
+        value = compute()
+        finished = time.time()
+        if cacheable is None or cacheable(value):
+            entry = (value, finished - started, finished + timeout)
+            cache.set(key, entry, timeout + stale)
+    finally:
+        cache.delete(lock_key(key))
+    return value
+
+
+def page_cache_key(request, key_prefix, version):
+    """Ключ страницы: адрес и куки, от которых зависит её вид."""
+    source = [
+        request.build_absolute_uri(),
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    digest = hashlib.md5('|'.join(source).encode()).hexdigest()
+    return f'{key_prefix}:{version}:{digest}'
+
+
+def _page_cacheable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+    )
+
+
+def coalesced_cache_page(timeout, key_prefix, *parts, stale=None):
+    """versioned_cache_page с защитой от одновременных промахов.
+
+    Страницу после истечения timeout или смены версии перерисовывает
+    один запрос (см. coalesced_get); остальные ждут его или, пока не
+    прошло stale секунд (PAGE_CACHE_STALE_TIMEOUT), получают прежнюю.
+    Ключ зависит от сессии пользователя, как у cache_page с Vary: Cookie.
+    """
+    parts = parts or (key_prefix,)
+    if stale is None:
+        stale = settings.PAGE_CACHE_STALE_TIMEOUT
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            version = get_version(*parts)
+            if (
+                request.method not in ('GET', 'HEAD')
+                or not replica_safe(version)
+            ):
+                return view_func(request, *args, **kwargs)
+
+            def render():
+                response = view_func(request, *args, **kwargs)
+                if callable(getattr(response, 'render', None)):
+                    response = response.render()
+                return response
+
+            return revalidate_in_browser(
+                coalesced_get(
+                    page_cache_key(request, key_prefix, version),
+                    render,
+                    timeout,
+                    stale,
+                    cacheable=_page_cacheable,
+                )
+            )
+        return wrapper
+    return decorator
+
+
+def versioned_etag(request, *keys):
+    """ETag страницы по версиям её содержимого.
+
+    keys - кортежи частей версий (как у get_version). В тег входят
+    также пользователь и GET-параметры: страницы выглядят по-разному
+    для разных пользователей и разных страниц пагинации.
+    """
+    source = [get_version(*parts) for parts in keys]
+    if not replica_safe(*source):
+        return None
+    source += [str(request.user.pk), request.GET.urlencode()]
+    return hashlib.md5('|'.join(source).encode()).hexdigest()
@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorCounter, Comment, Follow, Group, Post, User
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        # Рассинхронизированный счётчик не уходит ниже нуля
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_author_posts(author_id, delta):
+    if delta > 0:
+        AuthorCounter.objects.get_or_create(author_id=author_id)
+    _change(
+        AuthorCounter.objects.filter(author_id=author_id),
+        'posts_count',
+        delta,
+    )
+
+
+def change_author_followers(author_id, delta):
+    if delta > 0:
+        AuthorCounter.objects.get_or_create(author_id=author_id)
+    _change(
+        AuthorCounter.objects.filter(author_id=author_id),
+        'followers_count',
+        delta,
+    )
+
+
+def change_group_posts(group_id, delta):
+    if group_id is not None:
+        _change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post_comments(post_id, delta):
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def get_posts_count(author):
+    """Число постов автора по счётчику, без COUNT по постам."""
+    try:
+        return author.counter.posts_count
+    except AuthorCounter.DoesNotExist:
+        return 0
+
+
+def get_followers_count(author):
+    try:
+        return author.counter.followers_count
+    except AuthorCounter.DoesNotExist:
+        return 0
+
+
+def _actual_count(model, field):
+    """Подзапрос с настоящим числом строк model, ссылающихся на OuterRef."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def _reconcile(queryset, field, actual):
+    drifted = queryset.annotate(actual=actual).exclude(
+        **{field: F('actual')}
+    )
+    return queryset.model.objects.filter(
+        pk__in=drifted.values('pk')
+    ).update(**{field: actual})
+
+
+def reconcile_counters():
+    """Пересчитывает все счётчики по базе.
+
+    Возвращает словарь с числом исправленных строк по каждому счётчику.
+    """
+    with transaction.atomic():
+        AuthorCounter.objects.bulk_create(
+            [
+                AuthorCounter(author_id=pk)
+                for pk in User.objects.filter(
+                    Q(posts__isnull=False) | Q(following__isnull=False),
+                    counter__isnull=True,
+                ).distinct().values_list('pk', flat=True)
+            ],
+            batch_size=500,
+        )
+        return {
+            'author.posts_count': _reconcile(
+                AuthorCounter.objects.all(),
+                'posts_count',
+                _actual_count(Post, 'author'),
+            ),
+            'author.followers_count': _reconcile(
+                AuthorCounter.objects.all(),
+                'followers_count',
+                _actual_count(Follow, 'author'),
+            ),
+            'group.posts_count': _reconcile(
+                Group.objects.all(),
+                'posts_count',
+                _actual_count(Post, 'group'),
+            ),
+            'post.comments_count': _reconcile(
+                Post.objects.all(),
+                'comments_count',
+                _actual_count(Comment, 'post'),
+            ),
+        }
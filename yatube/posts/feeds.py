@@ -0,0 +1,254 @@
+import io
+import json
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import feedgenerator
+from django.utils.text import Truncator
+from django.utils.xmlutils import SimplerXMLGenerator
+from django.views.decorators.http import etag
+
+from .cache import versioned_etag
+from .models import Post
+from .utils import (
+    CURSOR_AFTER, KeysetPaginator, decode_cursor, encode_cursor,
+)
+from .views import get_author, get_group
+
+# Курсор инкрементальной синхронизации: посты новее него, от старых
+# к новым. Клиент передаёт курсор последнего полученного поста.
+CURSOR_SINCE = 'since'
+ITEMS_MARKER = '<!--items-->'
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+
+
+class StreamingFeedMixin:
+    """Отдаёт RSS/Atom по частям, не собирая документ в памяти.
+
+    Заголовок и хвост документа пишет обычный write() фида, а на
+    месте списка записей оставляется метка; записи пишутся по одной.
+    Ссылка rel="next" (RFC 5005) известна только после записей, поэтому
+    пишется после них: порядок элементов фида не важен.
+    """
+    # Элемент ссылки на следующую порцию
+    next_link_tag = 'link'
+
+    def write_items(self, handler):
+        handler.ignorableWhitespace(ITEMS_MARKER)
+
+    def stream(self, items, next_url=lambda: None):
+        """items - итератор словарей с аргументами add_item.
+
+        next_url() вызывается после записей и возвращает адрес
+        следующей порции или None.
+        """
+        document = self.writeString('utf-8')
+        head, tail = document.split(ITEMS_MARKER)
+        yield head
+        for item in items:
+            self.items = []
+            self.add_item(**item)
+            chunk = io.StringIO()
+            super().write_items(SimplerXMLGenerator(chunk, 'utf-8'))
+            yield chunk.getvalue()
+        url = next_url()
+        if url is not None:
+            chunk = io.StringIO()
+            SimplerXMLGenerator(chunk, 'utf-8').addQuickElement(
+                self.next_link_tag, None, {'rel': 'next', 'href': url}
+            )
+            yield chunk.getvalue()
+        yield tail
+
+
+class StreamingRssFeed(StreamingFeedMixin, feedgenerator.Rss201rev2Feed):
+    # Пространство имён atom объявляет сам Rss201rev2Feed
+    next_link_tag = 'atom:link'
+
+
+class StreamingAtomFeed(StreamingFeedMixin, feedgenerator.Atom1Feed):
+    pass
+
+
+XML_FEEDS = {
+    'rss': StreamingRssFeed,
+    'atom': StreamingAtomFeed,
+}
+
+
+def feed_posts(request, posts):
+    """Посты фида с учётом курсоров ?after= и ?since= и лимита ?limit=.
+
+    Возвращает итератор постов и имя параметра для следующего запроса.
+    """
+    try:
+        limit = int(request.GET.get('limit', settings.FEED_ITEMS))
+    except ValueError:
+        limit = settings.FEED_ITEMS
+    limit = min(max(limit, 1), settings.FEED_MAX_ITEMS)
+    paginator = KeysetPaginator(
+        posts.select_related('author', 'group'), limit
+    )
+    since = request.GET.get(CURSOR_SINCE)
+    next_param = CURSOR_AFTER
+    if decode_cursor(since) is not None:
+        next_param = CURSOR_SINCE
+    posts = paginator.iterator(
+        after=request.GET.get(CURSOR_AFTER), since=since
+    )
+    return posts, next_param
+
+
+def next_feed_url(request, next_param, last):
+    """Адрес порции после поста last; None, если постов не было."""
+    if last is None:
+        return None
+    query = request.GET.copy()
+    query.pop(CURSOR_SINCE, None)
+    query.pop(CURSOR_AFTER, None)
+    query[next_param] = encode_cursor(last.pub_date, last.pk)
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def feed_item(request, post):
+    link = request.build_absolute_uri(
+        reverse('posts:post_detail', args=(post.pk,))
+    )
+    return {
+        'title': Truncator(post.text).chars(50),
+        'link': link,
+        'description': post.text,
+        'author_name': post.author.get_full_name() or post.author.username,
+        'pubdate': post.pub_date,
+        'unique_id': link,
+        'categories': [post.group.title] if post.group else None,
+    }
+
+
+def xml_feed(request, posts, feed_class, title, link, description):
+    feed = feed_class(
+        title=title,
+        link=request.build_absolute_uri(link),
+        description=description,
+        feed_url=request.build_absolute_uri(),
+        language='ru',
+    )
+    posts, next_param = feed_posts(request, posts)
+    last = None
+
+    def items():
+        nonlocal last
+        for post in posts:
+            last = post
+            yield feed_item(request, post)
+
+    return StreamingHttpResponse(
+        feed.stream(
+            items(), lambda: next_feed_url(request, next_param, last)
+        ),
+        content_type=feed.content_type,
+    )
+
+
+def json_feed(request, posts, title, link, description):
+    """JSON Feed 1.1; next_url ведёт на следующую порцию постов."""
+    posts, next_param = feed_posts(request, posts)
+
+    def stream():
+        header = json.dumps({
+            'version': JSON_FEED_VERSION,
+            'title': title,
+            'home_page_url': request.build_absolute_uri(link),
+            'feed_url': request.build_absolute_uri(),
+            'description': description,
+        }, ensure_ascii=False)
+        yield header[:-1] + ', "items": ['
+        last = None
+        for post in posts:
+            item = feed_item(request, post)
+            data = {
+                'id': item['unique_id'],
+                'url': item['link'],
+                'title': item['title'],
+                'content_text': post.text,
+                'date_published': post.pub_date.isoformat(),
+                'authors': [{'name': item['author_name']}],
+            }
+            if item['categories']:
+                data['tags'] = item['categories']
+            if post.image:
+                data['image'] = request.build_absolute_uri(post.image.url)
+            data = json.dumps(data, ensure_ascii=False)
+            yield data if last is None else ',' + data
+            last = post
+        next_url = next_feed_url(request, next_param, last)
+        yield '], "next_url": ' + json.dumps(next_url) + '}'
+
+    return StreamingHttpResponse(
+        stream(), content_type='application/feed+json; charset=utf-8'
+    )
+
+
+def render_feed(request, fmt, posts, title, link, description):
+    if fmt == 'json':
+        return json_feed(request, posts, title, link, description)
+    if fmt not in XML_FEEDS:
+        raise Http404
+    return xml_feed(
+        request, posts, XML_FEEDS[fmt], title, link, description
+    )
+
+
+# Фиды кешируются браузерами и агрегаторами по тем же версиям, что и
+# HTML-страницы.
+def index_feed_etag(request, fmt):
+    return versioned_etag(request, ('index_page',))
+
+
+def group_feed_etag(request, slug, fmt):
+    return versioned_etag(request, ('group', get_group(request, slug).pk))
+
+
+def profile_feed_etag(request, username, fmt):
+    author = get_author(request, username)
+    return versioned_etag(request, ('author', author.pk))
+
+
+@etag(index_feed_etag)
+def index_feed(request, fmt):
+    return render_feed(
+        request,
+        fmt,
+        Post.objects.all(),
+        'Yatube: последние записи',
+        reverse('posts:index'),
+        'Последние обновления на сайте',
+    )
+
+
+@etag(group_feed_etag)
+def group_feed(request, slug, fmt):
+    group = get_group(request, slug)
+    return render_feed(
+        request,
+        fmt,
+        group.posts.all(),
+        f'Yatube: {group.title}',
+        reverse('posts:group_list', args=(group.slug,)),
+        group.description,
+    )
+
+
+@etag(profile_feed_etag)
+def profile_feed(request, username, fmt):
+    author = get_author(request, username)
+    name = author.get_full_name() or author.username
+    return render_feed(
+        request,
+        fmt,
+        Post.objects.filter(author=author),
+        f'Yatube: записи {name}',
+        reverse('posts:profile', args=(author.username,)),
+        f'Все записи пользователя {name}',
+    )
@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.db import transaction
+
+from core.tasks import enqueue
+
+from .models import AuthorCounter, Follow, Post, TimelineEntry
+from .utils import KeysetPaginator
+
+
+def is_pulled(author_id):
+    """Читаются ли посты автора при показе ленты, а не раскладываются.
+
+    Посты авторов с числом подписчиков больше FOLLOW_FANOUT_LIMIT
+    не копируются в ленты: это были бы слишком большие записи на
+    каждый пост. Такие посты подмешиваются в ленту при чтении.
+    """
+    return AuthorCounter.objects.filter(
+        author_id=author_id,
+        followers_count__gt=settings.FOLLOW_FANOUT_LIMIT,
+    ).exists()
+
+
+def pulled_authors(user):
+    """Авторы из подписок user, посты которых читаются при показе."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__counter__followers_count__gt=(
+                settings.FOLLOW_FANOUT_LIMIT
+            ),
+        ).values_list('author_id', flat=True)
+    )
+
+
+def _add_entries(user_ids, posts):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.pk,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in user_ids
+            for post in posts
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out(post_id):
+    """Добавляет пост в ленты всех подписчиков его автора."""
+    post = Post.objects.filter(pk=post_id).only(
+        'author_id', 'pub_date'
+    ).first()
+    if post is None or is_pulled(post.author_id):
+        return
+    _add_entries(
+        Follow.objects.filter(author_id=post.author_id).values_list(
+            'user_id', flat=True
+        ),
+        [post],
+    )
+
+
+def schedule_fan_out(post_id):
+    """Раскладывает пост по лентам в фоне после фиксации транзакции."""
+    transaction.on_commit(lambda: enqueue(fan_out, post_id))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту нового подписчика последние посты автора.
+
+    Копируется не больше FOLLOW_BACKFILL_POSTS постов: более старые
+    посты автора остаются в его профиле.
+    """
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        'author_id', 'pub_date'
+    ).order_by('-pub_date', '-pk')[:settings.FOLLOW_BACKFILL_POSTS]
+    _add_entries([user_id], posts)
+
+
+def drop(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+
+
+class FollowFeedPaginator(KeysetPaginator):
+    """Курсорная пагинация ленты подписок.
+
+    Лента читается диапазоном индекса по строкам TimelineEntry
+    пользователя; посты авторов, которые не раскладываются по лентам
+    (pulled_authors), берутся составным индексом по автору - отдельным
+    запросом на каждого. Из всех источников выбирается по странице,
+    а страница ленты собирается слиянием.
+    """
+
+    def __init__(self, user, per_page):
+        self.sources = [
+            KeysetPaginator(
+                TimelineEntry.objects.filter(user=user).select_related(
+                    'post__author', 'post__group'
+                ),
+                per_page,
+                key_field='post_id',
+            ),
+        ]
+        for author_id in pulled_authors(user):
+            self.sources.append(
+                KeysetPaginator(
+                    Post.objects.filter(author_id=author_id).select_related(
+                        'author', 'group'
+                    ),
+                    per_page,
+                )
+            )
+        super().__init__(TimelineEntry.objects.none(), per_page)
+
+    def _merge(self, querysets, reverse):
+        posts = {}
+        for queryset in querysets:
+            for obj in queryset[:self.per_page + 1]:
+                post = obj.post if isinstance(obj, TimelineEntry) else obj
+                posts[post.pk] = post
+        return sorted(
+            posts.values(),
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=reverse,
+        )
+
+    def _first(self):
+        return self._merge(
+            [source._first() for source in self.sources], reverse=True
+        )
+
+    def _before(self, key):
+        return self._merge(
+            [source._before(key) for source in self.sources], reverse=True
+        )
+
+    def _after(self, key):
+        return self._merge(
+            [source._after(key) for source in self.sources], reverse=False
+        )
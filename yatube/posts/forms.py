@@ -1,12 +1,32 @@
 from django import forms
 
+from .images import HeaderImageField
 from .models import Comment, Post
+from .uploads import completed_upload
 
 
 class PostForm(forms.ModelForm):
+    # Картинка, загруженная частями заранее (см. posts.uploads)
+    upload_id = forms.CharField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {'image': HeaderImageField}
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = cleaned_data.get('upload_id')
+        if upload_id and self.user is not None:
+            try:
+                cleaned_data['image'] = completed_upload(self.user, upload_id)
+            except forms.ValidationError as error:
+                self.add_error('upload_id', error)
+        return cleaned_data
 
 
 
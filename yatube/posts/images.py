@@ -0,0 +1,138 @@
+import io
+import os
+import time
+
+from django import forms
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from core.tasks import enqueue
+
+from .models import Post
+
+# Параметры пересохранения оригинала по формату
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 85},
+}
+
+
+def read_header(file):
+    """Формат и размеры картинки по её заголовку.
+
+    Image.open читает только заголовок, пиксели не декодируются, поэтому
+    проверка не зависит от размера файла. Неподходящий файл - ошибка
+    валидации.
+    """
+    source = file
+    if hasattr(file, 'temporary_file_path'):
+        source = file.temporary_file_path()
+    try:
+        with Image.open(source) as image:
+            image_format, size = image.format, image.size
+    except Exception:
+        raise forms.ValidationError(
+            forms.ImageField.default_error_messages['invalid_image'],
+            code='invalid_image',
+        )
+    finally:
+        if hasattr(file, 'seek'):
+            file.seek(0)
+    if image_format not in settings.POST_IMAGE_FORMATS:
+        raise forms.ValidationError(
+            'Формат %(format)s не поддерживается.',
+            code='invalid_format',
+            params={'format': image_format},
+        )
+    if size[0] * size[1] > settings.POST_IMAGE_MAX_PIXELS:
+        raise forms.ValidationError(
+            'Слишком большое изображение.', code='too_many_pixels'
+        )
+    return image_format, size
+
+
+class HeaderImageField(forms.ImageField):
+    """ImageField, который проверяет только заголовок картинки.
+
+    Стандартное поле вызывает Image.verify() и читает файл целиком
+    внутри запроса; полная обработка картинки делается в фоне
+    (см. normalize_original).
+    """
+
+    def to_python(self, data):
+        file = forms.FileField.to_python(self, data)
+        if file is None:
+            return None
+        image_format, _ = read_header(file)
+        file.content_type = Image.MIME.get(image_format)
+        return file
+
+
+def normalize_original(post):
+    """Пересохраняет оригинал картинки поста.
+
+    Картинка поворачивается по EXIF, теряет метаданные (EXIF с
+    геометкой, комментарии) и уменьшается до POST_IMAGE_MAX_SIZE по
+    длинной стороне. Выполняется фоновой задачей. Анимированные картинки
+    не трогаются. Файл заменяется под тем же именем, поэтому ссылки на
+    него (и у других постов с той же картинкой) остаются верными.
+    Возвращает True, если файл заменён.
+    """
+    image_field = post.image
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    with image_field.open('rb'), Image.open(image_field) as image:
+        if getattr(image, 'is_animated', False):
+            return False
+        image_format = image.format
+        options = dict(SAVE_OPTIONS.get(image_format, {}))
+        if image.info.get('icc_profile'):
+            options['icc_profile'] = image.info['icc_profile']
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, **options)
+    # Пока картинка обрабатывалась, её могли заменить при правке поста
+    if not Post.objects.filter(pk=post.pk, image=image_field.name).exists():
+        return False
+    # Устаревшие миниатюры удаляются вместе с записью sorl
+    default.kvstore.delete(ImageFile(image_field))
+    image_field.storage.replace(
+        image_field.name, ContentFile(buffer.getvalue())
+    )
+    return True
+
+
+def release_image(name):
+    """Удаляет файл картинки и его миниатюры, если на него не ссылаются.
+
+    Ссылки на файл - посты с этой картинкой. Файл, сохранённый за
+    последние MEDIA_GRACE_PERIOD секунд, не удаляется: его может
+    использовать пост из ещё не зафиксированной транзакции. Возвращает
+    True, если файл удалён.
+    """
+    if not name or Post.objects.filter(image=name).exists():
+        return False
+    storage = Post._meta.get_field('image').storage
+    try:
+        modified = os.path.getmtime(storage.path(name))
+    except OSError:
+        return False
+    if time.time() - modified < settings.MEDIA_GRACE_PERIOD:
+        return False
+    image_file = ImageFile(name, storage)
+    default.kvstore.delete(image_file)
+    image_file.delete()
+    return True
+
+
+def schedule_release(name):
+    """Освобождает картинку в фоне после фиксации транзакции."""
+    if name:
+        transaction.on_commit(lambda: enqueue(release_image, name))
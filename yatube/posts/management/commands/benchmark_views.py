@@ -0,0 +1,277 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.test import Client, override_settings
+from django.urls import reverse
+from faker import Faker
+
+from posts.models import Comment, Group, Post, User
+
+VIEWS = (
+    'index',
+    'group_posts',
+    'profile',
+    'post_detail',
+    'post_create',
+    'add_comment',
+)
+BENCH_USERNAME = 'benchmark'
+SAMPLE_SIZE = 500
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга, values отсортированы."""
+    if not values:
+        return None
+    rank = max(0, round(percent / 100 * len(values) + 0.5) - 1)
+    return values[min(rank, len(values) - 1)]
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _isolated_caches(directory):
+    """CACHES, в которых общие кеши лежат в каталоге directory.
+
+    Замер чистит кеш и наполняет его своими страницами, поэтому
+    настоящий общий кеш он трогать не должен. Кеши в памяти процесса
+    и двухуровневые кеши (их общий уровень - другой псевдоним)
+    остаются как есть.
+    """
+    local = ('TieredCache', 'LocMemCache', 'DummyCache')
+    caches = {}
+    for alias, params in settings.CACHES.items():
+        if params['BACKEND'].rsplit('.', 1)[-1] in local:
+            caches[alias] = params
+        else:
+            caches[alias] = {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': os.path.join(directory, alias),
+            }
+    return caches
+
+
+def _benchmark(database, directory, options):
+    """Замер в дочернем процессе на базе database.
+
+    Процесс получен через fork: соединение родителя в нём не
+    используется, а соединение default открывается заново к database.
+    Отчёт пишется в directory/report.json.
+    """
+    connections.databases['default'] = dict(
+        connections.databases['default'], NAME=database
+    )
+    del connections['default']
+    with override_settings(
+        CACHES=_isolated_caches(directory), DATABASE_REPLICAS=[]
+    ):
+        call_command('migrate', verbosity=0)
+        report = Command(stderr=options.get('stderr')).run(options)
+    connections.close_all()
+    with open(os.path.join(directory, 'report.json'), 'w') as file:
+        json.dump(report, file)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пропускную способность и задержки (p50/p99) '
+        'представлений постов и пишет результат в JSON. '
+        'Работает только на отдельной базе SQLite (--database): '
+        'с --seed команда наполняет её синтетическими данными.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', required=True,
+            help='Файл базы SQLite для замера; создаётся, если его нет',
+        )
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='Перед замером наполнить базу командой seed_posts',
+        )
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Число замеряемых запросов на представление',
+        )
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--views', default=','.join(VIEWS),
+            help='Представления через запятую',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом',
+        )
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Файл для JSON, по умолчанию stdout',
+        )
+
+    def handle(self, *args, **options):
+        database = os.path.abspath(options['database'])
+        configured = connections.databases['default']['NAME']
+        if database == os.path.abspath(configured):
+            raise CommandError(
+                'Замер пишет в базу: укажите отдельную базу, а не '
+                'настроенную в DATABASES.'
+            )
+        directory = tempfile.mkdtemp(prefix='benchmark_views_')
+        try:
+            process = multiprocessing.get_context('fork').Process(
+                target=_benchmark, args=(database, directory, options)
+            )
+            process.start()
+            process.join()
+            if process.exitcode:
+                raise CommandError('Замер завершился с ошибкой')
+            with open(os.path.join(directory, 'report.json')) as file:
+                report = json.load(file)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        report = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
+
+    def run(self, options):
+        """Наполняет базу (с --seed) и замеряет представления."""
+        self.random = random.Random(options['random_seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['random_seed'])
+        if options['seed']:
+            self.seed(options)
+        self.prepare_targets()
+        views = [name for name in options['views'].split(',') if name]
+        for name in views:
+            if name not in VIEWS:
+                raise ValueError(f'Неизвестное представление: {name}')
+        cache.clear()
+        results = {
+            name: self.measure(name, options) for name in views
+        }
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'dataset': {
+                'users': User.objects.count(),
+                'groups': Group.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+            },
+            'options': {
+                name: options[name]
+                for name in ('requests', 'warmup', 'cold', 'random_seed')
+            },
+            'results': results,
+        }
+
+    def seed(self, options):
+        call_command(
+            'seed_posts',
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            random_seed=options['random_seed'],
+            stdout=self.stderr,
+        )
+
+    def prepare_targets(self):
+        """Выборка групп, авторов и постов, по которым идут запросы."""
+        bounds = Post.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            raise ValueError('В базе нет постов, запустите с --seed')
+        self.post_ids = [
+            self.random.randint(bounds['low'], bounds['high'])
+            for _ in range(SAMPLE_SIZE)
+        ]
+        self.slugs = list(
+            Group.objects.values_list('slug', flat=True)[:SAMPLE_SIZE]
+        )
+        self.usernames = list(
+            User.objects.filter(
+                posts__pk__in=self.post_ids
+            ).values_list('username', flat=True).distinct()
+        )
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        self.guest = Client()
+        self.member = Client()
+        self.member.force_login(user)
+
+    def request(self, name):
+        """Выполняет один запрос к представлению name."""
+        choice = self.random.choice
+        if name == 'index':
+            return self.guest.get(
+                reverse('posts:index'), {'page': self.random.randint(1, 5)}
+            )
+        if name == 'group_posts':
+            return self.guest.get(
+                reverse('posts:group_list', args=[choice(self.slugs)])
+            )
+        if name == 'profile':
+            return self.guest.get(
+                reverse('posts:profile', args=[choice(self.usernames)])
+            )
+        if name == 'post_detail':
+            return self.guest.get(
+                reverse('posts:post_detail', args=[choice(self.post_ids)])
+            )
+        if name == 'post_create':
+            return self.member.post(
+                reverse('posts:post_create'),
+                {'text': self.fake.sentence()},
+            )
+        return self.member.post(
+            reverse('posts:add_comment', args=[choice(self.post_ids)]),
+            {'text': self.fake.sentence()},
+        )
+
+    def measure(self, name, options):
+        for _ in range(options['warmup']):
+            self.request(name)
+        timings = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            if options['cold']:
+                cache.clear()
+            start = time.perf_counter()
+            response = self.request(name)
+            timings.append(time.perf_counter() - start)
+            # 404 на удалённый пост в выборке тоже считается ошибкой
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - started
+        timings.sort()
+        return {
+            'requests': len(timings),
+            'errors': errors,
+            'throughput_rps': round(len(timings) / elapsed, 2),
+            'mean_ms': milliseconds(sum(timings) / len(timings)),
+            'p50_ms': milliseconds(percentile(timings, 50)),
+            'p99_ms': milliseconds(percentile(timings, 99)),
+            'max_ms': milliseconds(timings[-1]),
+        }
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts.media import BATCH_SIZE, collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки без постов, ненужные миниатюры '
+        'и брошенные загрузки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--every', type=int, metavar='SECONDS',
+            help='Повторять сборку с этим интервалом, пока не остановят',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.collect(options)
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def collect(self, options):
+        dry_run = options['dry_run']
+        on_file = None
+        if options['verbosity'] > 1:
+            def on_file(kind, name, size):
+                self.stdout.write(f'{kind}: {name} ({filesizeformat(size)})')
+        report = collect_garbage(
+            dry_run=dry_run,
+            batch_size=options['batch_size'],
+            on_file=on_file,
+        )
+        action = 'будет удалено' if dry_run else 'удалено'
+        for kind, totals in report.items():
+            self.stdout.write(
+                f'{kind}: {action} {totals["files"]} файлов, '
+                f'{filesizeformat(totals["bytes"])}'
+            )
@@ -0,0 +1,256 @@
+import multiprocessing
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts.cache import bump_version
+from posts.counters import reconcile_counters
+from posts.models import Comment, Group, Post, User
+
+TEXTS_POOL = 1000
+IMAGES_DIR = 'posts/seed'
+LOCK_RETRIES = 20
+
+
+@contextmanager
+def explicit_dates():
+    """Даёт bulk_create сохранить заданные pub_date и created.
+
+    auto_now_add иначе перезаписал бы их текущим временем.
+    """
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Comment._meta.get_field('created'),
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _chunks(start, stop, size):
+    for low in range(start, stop, size):
+        yield low, min(low + size, stop)
+
+
+def _save_batch(objects, rnd):
+    """Сохраняет пачку, повторяя попытку при блокировке SQLite.
+
+    Параллельные писатели SQLite могут получить «database is locked»
+    сразу, без ожидания, когда оба пытаются взять блокировку записи.
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with transaction.atomic():
+                type(objects[0]).objects.bulk_create(objects)
+            return
+        except OperationalError as error:
+            if 'locked' not in str(error) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(rnd.uniform(0.05, 0.2) * (attempt + 1))
+
+
+def _insert(task):
+    """Вставляет строки [start, stop) одной модели, выполняется в воркере."""
+    kind, start, stop, context = task
+    if not apps.ready:
+        django.setup()
+    rnd = random.Random(f'{context["seed"]}:{kind}:{start}')
+    now = timezone.now()
+    seconds = context['days'] * 86400
+
+    def moment():
+        return now - timedelta(seconds=rnd.randrange(seconds or 1))
+
+    texts = context['texts']
+    with explicit_dates():
+        for low, high in _chunks(start, stop, context['batch_size']):
+            if kind == 'posts':
+                objects = [
+                    Post(
+                        text=rnd.choice(texts),
+                        author_id=rnd.choice(context['author_ids']),
+                        group_id=rnd.choice(context['group_ids']),
+                        image=(
+                            rnd.choice(context['images'])
+                            if context['images']
+                            and rnd.random() < context['image_ratio']
+                            else ''
+                        ),
+                        pub_date=moment(),
+                    )
+                    for _ in range(low, high)
+                ]
+            else:
+                objects = [
+                    Comment(
+                        text=rnd.choice(texts)[:200],
+                        author_id=rnd.choice(context['author_ids']),
+                        post_id=rnd.randint(*context['post_range']),
+                        created=moment(),
+                    )
+                    for _ in range(low, high)
+                ]
+            _save_batch(objects, rnd)
+    return stop - start
+
+
+class Command(BaseCommand):
+    help = (
+        'Быстро наполняет базу пользователями, группами, постами '
+        'и комментариями для нагрузочного тестирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов, вставляющих посты и комментарии',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='На сколько дней назад разбросать даты публикации',
+        )
+        parser.add_argument(
+            '--images', type=int, default=0,
+            help='Сколько картинок сгенерировать в MEDIA_ROOT',
+        )
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.3,
+            help='Доля постов с картинкой',
+        )
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['random_seed'])
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['random_seed'])
+        # Имена новые при каждом запуске, иначе повторный запуск на той же
+        # базе упрётся в уникальность; случайность с seed - только для
+        # содержимого
+        self.prefix = f'seed{uuid.uuid4().hex[:8]}_'
+        self.batch_size = options['batch_size']
+        self.timed('users', options['users'], self.create_users, fake)
+        self.timed('groups', options['groups'], self.create_groups, fake)
+        context = {
+            'seed': options['random_seed'],
+            'batch_size': self.batch_size,
+            'days': options['days'],
+            'texts': [
+                fake.text(max_nb_chars=300) for _ in range(TEXTS_POOL)
+            ],
+            'author_ids': list(
+                User.objects.filter(username__startswith=self.prefix)
+                .values_list('pk', flat=True)
+            ) or list(User.objects.values_list('pk', flat=True)),
+            'group_ids': list(Group.objects.values_list('pk', flat=True))
+            + [None],
+            'images': self.create_images(options['images']),
+            'image_ratio': options['image_ratio'],
+        }
+        if not context['author_ids']:
+            raise ValueError('Нет пользователей для постов')
+        low = (Post.objects.aggregate(high=Max('pk'))['high'] or 0) + 1
+        self.timed(
+            'posts', options['posts'], self.run_workers,
+            'posts', options, context,
+        )
+        # Комментарии ссылаются только на только что созданные посты:
+        # их id идут подряд, а в старых могут быть дыры от удалений
+        high = Post.objects.aggregate(high=Max('pk'))['high'] or 0
+        if high >= low:
+            context['post_range'] = (low, high)
+            self.timed(
+                'comments', options['comments'], self.run_workers,
+                'comments', options, context,
+            )
+        reconcile_counters()
+        bump_version('index_page')
+
+    def timed(self, name, total, action, *args):
+        if total <= 0:
+            return
+        start = time.perf_counter()
+        action(total, *args)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{name}: {total} строк за {elapsed:.1f} с, '
+            f'{total / elapsed:.0f} строк/с'
+        )
+
+    def create_users(self, total, fake):
+        with transaction.atomic():
+            for low, high in _chunks(0, total, self.batch_size):
+                User.objects.bulk_create([
+                    User(
+                        username=f'{self.prefix}{number}',
+                        first_name=fake.first_name(),
+                        last_name=fake.last_name(),
+                        password='!',
+                    )
+                    for number in range(low, high)
+                ])
+
+    def create_groups(self, total, fake):
+        with transaction.atomic():
+            for low, high in _chunks(0, total, self.batch_size):
+                Group.objects.bulk_create([
+                    Group(
+                        title=fake.sentence(nb_words=3)[:200],
+                        slug=f'{self.prefix}{number}',
+                        description=fake.sentence(),
+                    )
+                    for number in range(low, high)
+                ])
+
+    def create_images(self, total):
+        """Генерирует total картинок, которые потом делят между постами."""
+        directory = os.path.join(settings.MEDIA_ROOT, IMAGES_DIR)
+        if total:
+            os.makedirs(directory, exist_ok=True)
+        names = []
+        for number in range(total):
+            name = f'{IMAGES_DIR}/{self.prefix}{number}.jpg'
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            Image.new('RGB', (1280, 720), color).save(
+                os.path.join(settings.MEDIA_ROOT, name), quality=80
+            )
+            names.append(name)
+        return names
+
+    def run_workers(self, total, kind, options, context):
+        workers = max(1, options['workers'])
+        # Каждому воркеру несколько заданий, чтобы он не простаивал
+        size = max(self.batch_size, -(-total // (workers * 4)))
+        tasks = [
+            (kind, low, high, context) for low, high in _chunks(0, total, size)
+        ]
+        if workers == 1:
+            for task in tasks:
+                _insert(task)
+            return
+        # Соединения родителя нельзя делить с дочерними процессами
+        connections.close_all()
+        with multiprocessing.Pool(workers) as pool:
+            for _ in pool.imap_unordered(_insert, tasks):
+                pass
@@ -0,0 +1,155 @@
+import os
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from .models import Post
+from .thumbnails import thumbnail_file
+
+# Сколько файлов удаляется за раз (и строк читается из базы)
+BATCH_SIZE = 500
+
+
+def referenced_images(batch_size=BATCH_SIZE):
+    """Имена всех картинок постов, одним проходом по базе."""
+    return set(
+        Post.objects.exclude(image='').exclude(image__isnull=True)
+        .values_list('image', flat=True)
+        .iterator(chunk_size=batch_size)
+    )
+
+
+def referenced_thumbnails(images):
+    """Имена миниатюр POST_THUMBNAILS для картинок images.
+
+    Имена вычисляются, как это делает sorl, без обращения к хранилищу.
+    Миниатюры размеров, которых больше нет в POST_THUMBNAILS, в набор
+    не попадают.
+    """
+    storage = Post._meta.get_field('image').storage
+    return {
+        thumbnail_file(ImageFile(name, storage), alias).name
+        for name in images
+        for alias in settings.POST_THUMBNAILS
+    }
+
+
+def walk_files(root):
+    """Файлы каталога root и его подкаталогов: (путь, stat).
+
+    Каталог читается потоком через scandir, список файлов целиком
+    в памяти не собирается.
+    """
+    try:
+        entries = os.scandir(root)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.path, entry.stat(follow_symlinks=False)
+
+
+def find_garbage(batch_size=BATCH_SIZE):
+    """Ненужные файлы медиа: (вид, имя в хранилище, путь, размер).
+
+    Виды: 'images' - картинки в каталоге upload_to, на которые не
+    ссылается ни один пост; 'thumbnails' - миниатюры, не нужные ни одной
+    картинке поста (удалённых картинок и устаревших размеров);
+    'uploads' - незаконченные загрузки старше UPLOAD_EXPIRY. Картинки и
+    миниатюры моложе MEDIA_GRACE_PERIOD пропускаются: на них может
+    ссылаться ещё не зафиксированная транзакция.
+    """
+    now = time.time()
+    images = referenced_images(batch_size)
+    field = Post._meta.get_field('image')
+    roots = (
+        ('images', field.storage, field.upload_to, images),
+        (
+            'thumbnails',
+            default.storage,
+            sorl_settings.THUMBNAIL_PREFIX,
+            referenced_thumbnails(images),
+        ),
+    )
+    for kind, storage, directory, referenced in roots:
+        location = storage.path('')
+        for path, stat in walk_files(storage.path(directory)):
+            name = os.path.relpath(path, location).replace(os.sep, '/')
+            if name in referenced:
+                continue
+            if now - stat.st_mtime < settings.MEDIA_GRACE_PERIOD:
+                continue
+            yield kind, name, path, stat.st_size
+    for path, stat in walk_files(settings.UPLOAD_DIR):
+        if now - stat.st_mtime >= settings.UPLOAD_EXPIRY:
+            yield 'uploads', os.path.basename(path), path, stat.st_size
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _delete_batch(batch):
+    """Удаляет пачку файлов и записи sorl о них."""
+    images = [name for kind, name, _, _ in batch if kind == 'images']
+    # Пока шёл обход, на картинку мог сослаться новый пост
+    alive = set(
+        Post.objects.filter(image__in=images).values_list('image', flat=True)
+    )
+    storages = {
+        'images': Post._meta.get_field('image').storage,
+        'thumbnails': default.storage,
+    }
+    deleted, keys = [], []
+    for kind, name, path, size in batch:
+        if name in alive:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        deleted.append((kind, name, path, size))
+        if kind in storages:
+            key = ImageFile(name, storages[kind]).key
+            keys.append(add_prefix(key))
+            if kind == 'images':
+                keys.append(add_prefix(key, 'thumbnails'))
+    if keys:
+        default.kvstore._delete_raw(*keys)
+    return deleted
+
+
+def collect_garbage(dry_run=False, batch_size=BATCH_SIZE, on_file=None):
+    """Удаляет ненужные файлы медиа (см. find_garbage) пачками.
+
+    С dry_run ничего не удаляется, только считается. on_file(вид, имя,
+    размер) вызывается для каждого удалённого (или найденного) файла.
+    Возвращает {вид: {'files': число, 'bytes': размер}}.
+    """
+    report = defaultdict(lambda: {'files': 0, 'bytes': 0})
+    for batch in _batches(find_garbage(batch_size), batch_size):
+        if not dry_run:
+            batch = _delete_batch(batch)
+        for kind, name, _, size in batch:
+            report[kind]['files'] += 1
+            report[kind]['bytes'] += size
+            if on_file is not None:
+                on_file(kind, name, size)
+    return {
+        kind: dict(report[kind])
+        for kind in ('images', 'thumbnails', 'uploads')
+    }
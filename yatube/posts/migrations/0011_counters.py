@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    AuthorCounter = apps.get_model('posts', 'AuthorCounter')
+    Comment = apps.get_model('posts', 'Comment')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    AuthorCounter.objects.bulk_create(
+        [
+            AuthorCounter(author_id=row['author'], posts_count=row['count'])
+            for row in Post.objects.order_by().values('author').annotate(
+                count=Count('pk')
+            )
+        ],
+        batch_size=500,
+    )
+    for row in Post.objects.order_by().filter(group__isnull=False).values(
+        'group'
+    ).annotate(count=Count('pk')):
+        Group.objects.filter(pk=row['group']).update(posts_count=row['count'])
+    for row in Comment.objects.order_by().values('post').annotate(
+        count=Count('pk')
+    ):
+        Post.objects.filter(pk=row['post']).update(
+            comments_count=row['count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_auto_20230309_1410'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorCounter',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
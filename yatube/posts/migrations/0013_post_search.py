@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from posts.search import drop_index, install_index
+
+
+def create_search_index(apps, schema_editor):
+    install_index(schema_editor.connection, rebuild=True)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
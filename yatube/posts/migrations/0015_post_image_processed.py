@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-17 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_follow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_processed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
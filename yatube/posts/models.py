@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+
+from core.storage import ContentAddressedStorage
 
 
 User = get_user_model()
@@ -10,6 +12,7 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.title
@@ -20,36 +23,62 @@ class Post(models.Model):
         help_text="Текст нового поста", verbose_name="Текст поста"
     )
     pub_date = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Отдельные индексы по FK не нужны: их заменяют составные из Meta
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name='posts'
+        User, on_delete=models.CASCADE, related_name='posts', db_index=False
     )
     group = models.ForeignKey(
         'Group',
         blank=True,
         null=True,
+        db_index=False,
         on_delete=models.SET_NULL,
         related_name='posts',
         help_text="Группа, к которой будет относиться пост",
         verbose_name="Группа",
     )
+    # Файлы называются по содержимому и общие у одинаковых картинок;
+    # индекс нужен, чтобы считать ссылки на файл (см. release_image)
     image = models.ImageField(
         verbose_name="Картинка",
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        db_index=True,
         blank=True,
         null=True)
+    # Оригинал пересохранён и миниатюры построены (см. posts.thumbnails)
+    image_processed = models.BooleanField(default=False, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-pub_date']
+        # Под ленты автора и группы: фильтр по FK и сортировка по дате
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[: settings.SLICE_LETTERS]
 
+    def save(self, *args, **kwargs):
+        # Счётчики обновляются сигналами в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
         related_name='comments',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
@@ -60,8 +89,105 @@ class Comment(models.Model):
     created = models.DateTimeField(
         auto_now_add=True
     )
+
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class AuthorCounter(models.Model):
+    """Счётчики автора, которые нельзя хранить в модели User."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counter',
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.author}: {self.posts_count}'
+
+
+class Follow(models.Model):
+    """Подписка пользователя user на автора author."""
+    # Записи пользователя ищутся по уникальному индексу (user, author)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follower',
+        db_index=False,
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='following',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='follow_unique'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='follow_not_self',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user} -> {self.author}'
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок пользователя (см. posts.follow).
+
+    Строки пишутся при публикации поста для каждого подписчика автора,
+    поэтому лента читается диапазоном индекса по (user, pub_date).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        db_index=False,
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='timeline_entries'
+    )
+    # Копии полей поста: по ним лента сортируется и чистится без JOIN.
+    # Строки автора удаляются вместе с его постами (каскад по post),
+    # так что отдельный каскад и индекс по author не нужны.
+    author = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, related_name='+', db_index=False
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date', '-post']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='timeline_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user}: {self.post_id}'
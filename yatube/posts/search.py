@@ -0,0 +1,152 @@
+import re
+
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+# Внешний индекс FTS5 над posts_post.text: сам текст в индексе не
+# хранится, а синхронизируется триггерами при любой записи в таблицу,
+# в том числе при bulk_create и update().
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+)
+TRIGGERS_SQL = (
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert "
+    "AFTER INSERT ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete "
+    "AFTER DELETE ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update "
+    "AFTER UPDATE OF text ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); "
+    "END",
+)
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+DROP_SQL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install_index(using, rebuild=False):
+    """Создаёт индекс и триггеры; rebuild заново индексирует все посты."""
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in CREATE_SQL + TRIGGERS_SQL:
+            cursor.execute(sql)
+        if rebuild:
+            cursor.execute(REBUILD_SQL)
+
+
+def drop_index(using):
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+def fts_query(text):
+    """Запрос пользователя в синтаксис MATCH.
+
+    Операторы FTS5 из ввода не принимаются: каждое слово становится
+    префиксом в кавычках, все слова должны встретиться в тексте.
+    """
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class PostSearchResults:
+    """Найденные посты в порядке релевантности (bm25).
+
+    Поддерживает count() и срезы, поэтому подходит для Paginator:
+    из индекса выбираются только id нужной страницы, посты
+    догружаются одним запросом.
+    """
+
+    def __init__(self, query):
+        self.match = fts_query(query)
+
+    def count(self):
+        if not self.match:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [self.match],
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.match:
+            return []
+        start = index.start or 0
+        limit = -1 if index.stop is None else index.stop - start
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s ORDER BY rank '
+                'LIMIT %s OFFSET %s',
+                [self.match, limit, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def _filter_like(queryset, query):
+    for word in re.findall(r'\w+', query):
+        queryset = queryset.filter(text__icontains=word)
+    return queryset
+
+
+def search_posts(query):
+    """Посты, подходящие под запрос: через FTS5 или, без него, LIKE."""
+    if fts_available():
+        return PostSearchResults(query)
+    return _filter_like(
+        Post.objects.select_related('author', 'group'), query
+    ).order_by('-pub_date', '-pk')
+
+
+def filter_posts(queryset, query):
+    """Сужает queryset до найденных постов (порядок не меняется)."""
+    if not fts_available():
+        return _filter_like(queryset, query)
+    match = fts_query(query)
+    if not match:
+        return queryset
+    # pk__in=RawSQL(...) даёт «IN ((SELECT ...))», что SQLite читает
+    # как список из одного скалярного подзапроса, поэтому условие
+    # подставляется как есть
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        where=[
+            f'"{table}"."id" IN (SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)'
+        ],
+        params=[match],
+    )
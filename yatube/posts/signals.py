@@ -0,0 +1,211 @@
+from django.db import connections
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_save,
+)
+from django.dispatch import receiver
+
+from . import counters, follow
+from .cache import bump_version_on_commit
+from .images import schedule_release
+from .models import Comment, Follow, Group, Post, User
+from .search import FTS_TABLE, install_index
+from .thumbnails import schedule_thumbnails
+
+# Поля пользователя, которые показывают страницы с его постами
+AUTHOR_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_index(**kwargs):
+    """Сбрасывает кеш главной страницы при изменении её содержимого."""
+    bump_version_on_commit('index_page')
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, **kwargs):
+    """Запоминает прежние группу и картинку редактируемого поста."""
+    previous = None
+    if instance.pk is not None:
+        previous = sender.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image'
+        ).first()
+    instance._previous_group_id, instance._previous_image = (
+        previous or (None, '')
+    )
+    if instance.image.name != instance._previous_image:
+        instance.image_processed = False
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_lists(instance, **kwargs):
+    """Сбрасывает закешированные ленты группы и автора поста."""
+    bump_version_on_commit('author', instance.author_id)
+    group_ids = {
+        instance.group_id, getattr(instance, '_previous_group_id', None)
+    }
+    for group_id in group_ids - {None}:
+        bump_version_on_commit('group', group_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post(sender, instance, **kwargs):
+    """Меняет версию страницы поста при правке поста или комментариев."""
+    post_id = instance.pk if sender is Post else instance.post_id
+    bump_version_on_commit('post', post_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(instance, **kwargs):
+    bump_version_on_commit('group', instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_author(instance, **kwargs):
+    bump_version_on_commit('author', instance.pk)
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_names(sender, instance, update_fields=None,
+                            **kwargs):
+    """Запоминает прежние имена пользователя (см. invalidate_author_names).
+
+    Сохранение без этих полей (last_login при входе) базу не читает.
+    """
+    instance._previous_names = None
+    if instance.pk is None or (
+        update_fields is not None
+        and not set(update_fields) & set(AUTHOR_NAME_FIELDS)
+    ):
+        return
+    instance._previous_names = sender.objects.filter(
+        pk=instance.pk
+    ).values_list(*AUTHOR_NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_names(instance, **kwargs):
+    """Сбрасывает чужие страницы, где видно имя переименованного автора.
+
+    Имя автора есть на главной и в лентах групп его постов, имя
+    пользователя - в комментариях на страницах постов.
+    """
+    previous = getattr(instance, '_previous_names', None)
+    names = tuple(getattr(instance, name) for name in AUTHOR_NAME_FIELDS)
+    if previous is None or previous == names:
+        return
+    posts = Post.objects.filter(author=instance)
+    if posts.exists():
+        bump_version_on_commit('index_page')
+        group_ids = posts.exclude(group=None).values_list(
+            'group_id', flat=True
+        ).distinct()
+        for group_id in group_ids:
+            bump_version_on_commit('group', group_id)
+    if previous[0] != instance.username:
+        post_ids = Comment.objects.filter(author=instance).values_list(
+            'post_id', flat=True
+        ).distinct()
+        for post_id in post_ids:
+            bump_version_on_commit('post', post_id)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(instance, created, **kwargs):
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if created:
+        counters.change_author_posts(instance.author_id, 1)
+    elif previous_group_id == instance.group_id:
+        return
+    counters.change_group_posts(previous_group_id, -1)
+    counters.change_group_posts(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(instance, **kwargs):
+    counters.change_author_posts(instance.author_id, -1)
+    counters.change_group_posts(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(instance, created, **kwargs):
+    if created:
+        counters.change_post_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(instance, **kwargs):
+    counters.change_post_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(instance, created, **kwargs):
+    if created:
+        counters.change_author_followers(instance.author_id, 1)
+        follow.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(instance, **kwargs):
+    counters.change_author_followers(instance.author_id, -1)
+    follow.drop(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(instance, **kwargs):
+    """Профиль показывает подписчиков и кнопку подписки."""
+    bump_version_on_commit('author', instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(instance, created, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if created:
+        follow.schedule_fan_out(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def pregenerate_thumbnails(instance, **kwargs):
+    """Строит миниатюры новой картинки в фоне, до первого просмотра."""
+    if instance.image and instance.image.name != getattr(
+        instance, '_previous_image', ''
+    ):
+        schedule_thumbnails(instance.pk, on_commit=True)
+
+
+@receiver(post_save, sender=Post)
+def release_previous_image(instance, created, **kwargs):
+    """Удаляет заменённую картинку, если она больше нигде не нужна."""
+    previous_image = getattr(instance, '_previous_image', '')
+    if not created and previous_image != instance.image.name:
+        schedule_release(previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(instance, **kwargs):
+    schedule_release(instance.image.name)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    """Возвращает триггеры поискового индекса после миграций.
+
+    При изменении полей поста SQLite пересоздаёт таблицу posts_post,
+    и триггеры старой таблицы пропадают вместе с ней.
+    """
+    connection = connections[using]
+    if sender.name != 'posts' or connection.vendor != 'sqlite':
+        return
+    if FTS_TABLE in connection.introspection.table_names():
+        install_index(connection)
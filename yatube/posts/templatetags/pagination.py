@@ -0,0 +1,35 @@
+from django import template
+
+from ..utils import PAGE_WINDOW
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page, on_each_side=PAGE_WINDOW):
+    """Номера страниц вокруг текущей; None - пропуск («…»).
+
+    Первая страница показывается всегда, последняя - только если число
+    объектов известно точно.
+    """
+    paginator = page.paginator
+    last = paginator.num_pages
+    start = max(page.number - on_each_side, 1)
+    end = min(page.number + on_each_side, last)
+    numbers = list(range(start, end + 1))
+    if start > 1:
+        numbers = [1] + ([None] if start > 2 else []) + numbers
+    if not getattr(paginator, 'exact_count', True):
+        numbers.append(None)
+    elif end < last:
+        numbers += ([None] if end < last - 1 else []) + [last]
+    return numbers
+
+
+@register.filter
+def count_label(paginator):
+    """Число объектов вида «10 000» или «10 000+», если оно неточное."""
+    label = f'{paginator.count:,}'.replace(',', '\N{NO-BREAK SPACE}')
+    if not getattr(paginator, 'exact_count', True):
+        label += '+'
+    return label
@@ -0,0 +1,31 @@
+from django import template
+
+from ..thumbnails import attach_thumbnails, lookup_thumbnail
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image, alias='feed'):
+    """Миниатюра картинки поста или сама картинка, пока миниатюры нет."""
+    if not image:
+        return None
+    return lookup_thumbnail(image, alias) or image
+
+
+@register.filter
+def with_thumbnails(posts, alias='feed'):
+    """Посты страницы с post.thumbnail, найденными одним пакетом."""
+    return attach_thumbnails(posts, alias)
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post, alias='feed'):
+    """Картинка поста: <picture> с вариантами WebP/JPEG для srcset.
+
+    В лентах миниатюры уже подставлены фильтром with_thumbnails,
+    для отдельного поста они ищутся здесь.
+    """
+    if not hasattr(post, 'thumbnail'):
+        attach_thumbnails([post], alias)
+    return {'post': post}
@@ -0,0 +1,197 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from ..counters import reconcile_counters
+from ..media import walk_files
+from ..models import Comment, Group, Post, User
+from ..thumbnails import generate_thumbnails, lookup_thumbnail, thumbnail_file
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class BenchmarkViewsCommandTest(TestCase):
+    def test_benchmark_views(self):
+        """Бенчмарк наполняет свою базу и пишет замеры по представлениям."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command(
+                'benchmark_views',
+                database=os.path.join(directory, 'benchmark.sqlite3'),
+                seed=True,
+                users=5,
+                groups=2,
+                posts=30,
+                comments=40,
+                batch_size=7,
+                requests=3,
+                warmup=1,
+                output=output.name,
+                stderr=StringIO(),
+            )
+            report = json.load(output)
+        self.assertEqual(report['dataset']['posts'], 30 + 3 + 1)
+        self.assertEqual(report['dataset']['comments'], 40 + 3 + 1)
+        self.assertEqual(report['dataset']['groups'], 2)
+        # Настроенная база не тронута
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(User.objects.exists())
+        for name, result in report['results'].items():
+            with self.subTest(view=name):
+                self.assertEqual(result['requests'], 3)
+                self.assertEqual(result['errors'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_refuses_configured_database(self):
+        """Бенчмарк не запускается на базе из DATABASES."""
+        with self.assertRaises(CommandError):
+            call_command(
+                'benchmark_views',
+                database=connection.settings_dict['NAME'],
+            )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedPostsCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_seed_posts(self):
+        """Команда создаёт строки пачками, картинки и верные счётчики."""
+        call_command(
+            'seed_posts',
+            users=4,
+            groups=3,
+            posts=25,
+            comments=60,
+            batch_size=10,
+            images=2,
+            image_ratio=0.5,
+            days=30,
+            stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 25)
+        self.assertEqual(Comment.objects.count(), 60)
+        images = set(
+            Post.objects.exclude(image='').values_list('image', flat=True)
+        )
+        self.assertTrue(images)
+        for name in images:
+            self.assertTrue(
+                os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+            )
+        # Даты разбросаны, а не проставлены auto_now_add
+        self.assertGreater(
+            Post.objects.dates('pub_date', 'day').count(), 1
+        )
+        self.assertEqual(
+            reconcile_counters(),
+            {
+                'author.posts_count': 0,
+                'author.followers_count': 0,
+                'group.posts_count': 0,
+                'post.comments_count': 0,
+            },
+        )
+
+    def test_seed_posts_twice(self):
+        """Повторный запуск с тем же seed дополняет базу."""
+        for _ in range(2):
+            call_command(
+                'seed_posts', users=3, groups=2, posts=5, stdout=StringIO(),
+            )
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(Group.objects.count(), 4)
+        self.assertEqual(Post.objects.count(), 10)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    UPLOAD_DIR=os.path.join(TEMP_MEDIA_ROOT, 'uploads'),
+    BACKGROUND_TASKS_SYNC=True,
+    MEDIA_GRACE_PERIOD=60,
+    UPLOAD_EXPIRY=600,
+)
+class GcMediaCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (4, 2), color).save(buffer, format='PNG')
+        post = Post.objects.create(
+            author=self.user,
+            text=f'Пост {color}',
+            image=SimpleUploadedFile(f'{color}.png', buffer.getvalue()),
+        )
+        generate_thumbnails(post.pk)
+        post.refresh_from_db()
+        return post
+
+    def age(self, *paths):
+        old = time.time() - 3600
+        for path in paths:
+            os.utime(path, (old, old))
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+
+    def test_gc_media(self):
+        """Удаляются только файлы без ссылок и старше MEDIA_GRACE_PERIOD."""
+        kept = self.create_post('red')
+        orphan = self.create_post('green')
+        kept_thumbnails = [
+            thumbnail_file(kept.image, alias)
+            for alias in settings.POST_THUMBNAILS
+        ]
+        orphan_thumbnail = lookup_thumbnail(orphan.image)
+        # Сигналы на удаление в тесте не срабатывают: транзакция
+        # не фиксируется, файлы остаются на диске
+        Post.objects.filter(pk=orphan.pk).delete()
+        fresh = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'fresh.png')
+        upload = os.path.join(settings.UPLOAD_DIR, 'abandoned.part')
+        os.makedirs(settings.UPLOAD_DIR)
+        for path in (fresh, upload):
+            open(path, 'wb').close()
+        files = [
+            path for path, _ in walk_files(TEMP_MEDIA_ROOT) if path != fresh
+        ]
+        self.age(*files)
+
+        output = StringIO()
+        call_command('gc_media', dry_run=True, stdout=output)
+        self.assertIn('images: будет удалено 1 файлов', output.getvalue())
+        self.assertIn('uploads: будет удалено 1 файлов', output.getvalue())
+        self.assertTrue(orphan.image.storage.exists(orphan.image.name))
+
+        output = StringIO()
+        call_command('gc_media', verbosity=2, stdout=output)
+        self.assertIn(orphan.image.name, output.getvalue())
+        self.assertFalse(orphan.image.storage.exists(orphan.image.name))
+        self.assertFalse(orphan_thumbnail.exists())
+        self.assertIsNone(default.kvstore.get(ImageFile(orphan.image)))
+        self.assertFalse(os.path.exists(upload))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(kept.image.storage.exists(kept.image.name))
+        for thumbnail in kept_thumbnails:
+            self.assertTrue(thumbnail.exists())
+        self.assertIsNotNone(lookup_thumbnail(kept.image))
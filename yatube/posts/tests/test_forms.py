@@ -1,18 +1,34 @@
+import io
+import os
 import shutil
 import tempfile
+import threading
+import time
 from http import HTTPStatus
 
 from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Comment, Group, Post, User
+from ..thumbnails import generate_thumbnails
+from ..uploads import (
+    UploadError, completed_upload, start_upload, upload_offset, upload_path,
+    write_chunk,
+)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+def stored_name(name, content):
+    """Имя, под которым хранилище картинок сохранит content."""
+    return Post.image.field.storage.content_name(name, ContentFile(content))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_TASKS_SYNC=True)
 class PostCreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -79,7 +95,7 @@ class PostCreateFormTests(TestCase):
             Post.objects.filter(
                 group=form_data['group'],
                 text=form_data['text'],
-                image=f"posts/{form_data['image'].name}",
+                image=stored_name('posts/small.gif', self.small_gif),
             ).exists()
         )
 
@@ -103,7 +119,7 @@ class PostCreateFormTests(TestCase):
             Post.objects.filter(
                 group=form_data['group'],
                 text=form_data['text'],
-                image=f"posts/{form_data['image'].name}",
+                image=stored_name('posts/small.gif', self.small_gif),
             ).exists()
         )
         self.assertEqual(Post.objects.count(), self.post_count)
@@ -156,7 +172,7 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(Comment.objects.count(), comment_count)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_TASKS_SYNC=True)
 class PostEditFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -207,6 +223,7 @@ class PostEditFormTests(TestCase):
             'group': cls.new_group.id,
             'image': new_uploaded,
         }
+        cls.new_image_name = stored_name('posts/small_new.gif', new_small_gif)
         cls.authorized_client = Client()
         cls.authorized_client.force_login(cls.user)
 
@@ -232,7 +249,7 @@ class PostEditFormTests(TestCase):
             (response.status_code, HTTPStatus.OK),
             (self.post.text, self.form_data['text']),
             (self.post.group.id, self.form_data['group']),
-            (self.post.image.name,f"posts/{self.form_data['image'].name}"),
+            (self.post.image.name, self.new_image_name),
         )
         for value, expected in data_for_equal:
             with self.subTest(expected=expected):
@@ -244,3 +261,164 @@ class PostEditFormTests(TestCase):
                 kwargs={'post_id': self.post.id},
             ),
         )
+
+
+def make_image(size, image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    UPLOAD_DIR=os.path.join(TEMP_MEDIA_ROOT, 'uploads'),
+)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def start(self, content, name='picture.png'):
+        response = self.client.post(
+            reverse('posts:upload_create'),
+            {'name': name, 'size': len(content)},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        return reverse('posts:upload_detail', args=(response.json()['id'],))
+
+    def put(self, url, content, start, total):
+        return self.client.put(
+            url,
+            content,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=(
+                f'bytes {start}-{start + len(content) - 1}/{total}'
+            ),
+        )
+
+    def test_resumable_upload(self):
+        """Загрузка частями продолжается с принятого места."""
+        content = make_image((20, 10))
+        half = len(content) // 2
+        url = self.start(content)
+        response = self.put(url, content[:half], 0, len(content))
+        self.assertEqual(response.json()['offset'], half)
+        # Повтор уже принятой части не портит файл
+        response = self.put(url, content[:half], 0, len(content))
+        self.assertEqual(response.status_code, HTTPStatus.CONFLICT)
+        self.assertEqual(response.json()['offset'], half)
+        response = self.put(url, content[half:], half, len(content))
+        self.assertTrue(response.json()['complete'])
+        upload_id = response.json()['id']
+        self.client.force_login(self.other)
+        self.assertEqual(
+            self.client.get(url).status_code, HTTPStatus.NOT_FOUND
+        )
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с загрузкой', 'upload_id': upload_id},
+        )
+        post = Post.objects.get(text='Пост с загрузкой')
+        self.assertEqual(
+            post.image.name, stored_name('posts/picture.png', content)
+        )
+        self.assertEqual(post.image.read(), content)
+        self.assertFalse(os.path.exists(upload_path(upload_id)))
+
+    def test_completed_upload_closed_after_save(self):
+        """Файл загрузки закрывается, когда пост его сохранил."""
+        content = make_image((12, 10))
+        for attempt in ('новый файл', 'такой файл уже есть'):
+            with self.subTest(attempt=attempt):
+                upload = start_upload(self.user, 'picture.png', len(content))
+                write_chunk(
+                    upload, f'bytes 0-{len(content) - 1}/{len(content)}',
+                    io.BytesIO(content),
+                )
+                image = completed_upload(self.user, upload['id'])
+                Post.objects.create(
+                    author=self.user, text='Пост', image=image
+                )
+                self.assertTrue(image.closed)
+
+    def test_repeated_chunk_written_once(self):
+        """Повтор части во время записи первой попытки получает 409."""
+        content = make_image((20, 10))
+        upload = start_upload(self.user, 'picture.png', len(content))
+        half = len(content) // 2
+        content_range = f'bytes 0-{half - 1}/{len(content)}'
+
+        class SlowStream(io.BytesIO):
+            def read(self, size=-1):
+                time.sleep(0.05)
+                return super().read(size)
+
+        errors = []
+
+        def put():
+            try:
+                write_chunk(upload, content_range, SlowStream(content[:half]))
+            except UploadError as error:
+                errors.append(error.status)
+
+        threads = [threading.Thread(target=put) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [HTTPStatus.CONFLICT])
+        self.assertEqual(upload_offset(upload), half)
+        with open(upload_path(upload['id']), 'rb') as file:
+            self.assertEqual(file.read(), content[:half])
+
+    def test_upload_checked_by_header(self):
+        """Файл не-картинка отклоняется по заголовку."""
+        content = b'not an image at all'
+        url = self.start(content, 'fake.png')
+        response = self.put(url, content, 0, len(content))
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(url).status_code, HTTPStatus.NOT_FOUND
+        )
+        response = self.client.post(
+            reverse('posts:post_create'),
+            {
+                'text': 'Пост с подделкой',
+                'image': SimpleUploadedFile('fake.png', content),
+            },
+        )
+        self.assertFalse(Post.objects.filter(text='Пост с подделкой'))
+        self.assertEqual(
+            self.client.post(
+                reverse('posts:upload_create'),
+                {'name': 'huge.png', 'size': settings.UPLOAD_MAX_SIZE + 1},
+            ).status_code,
+            HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+        )
+
+    @override_settings(POST_IMAGE_MAX_SIZE=8)
+    def test_large_original_resized_in_background(self):
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с большой картинкой',
+            image=SimpleUploadedFile(
+                'large.jpg', make_image((32, 16), 'JPEG')
+            ),
+        )
+        name = post.image.name
+        generate_thumbnails(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, name)
+        self.assertTrue(post.image_processed)
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (8, 4))
@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.test import TestCase
 
-from ..models import Comment, Group, Post, User
+from ..counters import get_posts_count, reconcile_counters
+from ..models import AuthorCounter, Comment, Group, Post, User
 
 
 class PostModelTest(TestCase):
@@ -66,3 +67,75 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Другое описание',
+        )
+
+    def assertCounters(self, author_posts, group_posts, other_group_posts):
+        self.author.refresh_from_db()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(get_posts_count(self.author), author_posts)
+        self.assertEqual(self.group.posts_count, group_posts)
+        self.assertEqual(self.other_group.posts_count, other_group_posts)
+
+    def test_post_counters(self):
+        """Счётчики постов меняются при создании, правке и удалении."""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        Post.objects.create(author=self.author, text='Пост без группы')
+        self.assertCounters(2, 1, 0)
+        post.group = self.other_group
+        post.save()
+        self.assertCounters(2, 0, 1)
+        post.delete()
+        self.assertCounters(1, 0, 0)
+
+    def test_comment_counter(self):
+        """Счётчик комментариев поста."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.author, text='Комментарий'
+        )
+        Comment.objects.create(post=post, author=self.author, text='Ещё')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_reconcile_counters(self):
+        """Пересчёт исправляет рассинхронизацию счётчиков."""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.author, text='Текст')
+        AuthorCounter.objects.update(posts_count=10)
+        Group.objects.update(posts_count=5)
+        Post.objects.update(comments_count=0)
+        self.assertEqual(
+            reconcile_counters(),
+            {
+                'author.posts_count': 1,
+                'author.followers_count': 0,
+                'group.posts_count': 2,
+                'post.comments_count': 1,
+            },
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertCounters(1, 1, 0)
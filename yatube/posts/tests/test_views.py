@@ -1,18 +1,59 @@
+import io
+import json
 import shutil
 import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+from xml.etree import ElementTree
+
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-from django.test import Client, TestCase, override_settings
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 from django.conf import settings
 
-from posts.models import Comment, Group, Post, User
+from posts.cache import (
+    coalesced_cache_page, get_version, page_cache_key, versioned_cache_page,
+)
+from posts.models import (
+    AuthorCounter, Comment, Follow, Group, Post, TimelineEntry, User,
+)
+from posts.thumbnails import (
+    attach_thumbnails, generate_thumbnails, lookup_thumbnail,
+    schedule_thumbnails,
+)
+from posts.templatetags.pagination import count_label, page_window
+from posts.utils import (
+    BoundedCountPaginator, EstimatedCountPaginator, encode_cursor, make_page,
+)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
+# Фиксация транзакции в TestCase не наступает, поэтому отложенные
+# on_commit задачи выполняются сразу
+run_on_commit = mock.patch(
+    'django.db.transaction.on_commit', lambda func, using=None: func()
+)
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_TASKS_SYNC=True)
 class PostPagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -141,14 +182,34 @@ class PostPagesTests(TestCase):
     def test_cache_index(self):
         '''Проверка кеша главной страницы'''
         cache.clear()
+        # Первый показ строит миниатюры, и их готовность меняет версию
+        self.guest_client.get(reverse('posts:index'))
         response_1 = self.guest_client.get(reverse('posts:index'))
-        Post.objects.all().delete()
+        # update() не шлёт сигналов: страница должна остаться из кеша
+        Post.objects.update(text='Изменённый текст')
         response_2 = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(response_1.content,response_2.content)
         cache.clear()
         response_3 = self.guest_client.get(reverse('posts:index'))
         self.assertNotEqual(response_1.content,response_3.content)
 
+    def test_cache_index_invalidation(self):
+        '''Новый и удалённый пост сразу видны на главной'''
+        cache.clear()
+        response_1 = self.guest_client.get(reverse('posts:index'))
+        with run_on_commit:
+            new_post = Post.objects.create(
+                text='Свежий пост для главной',
+                author=self.author,
+            )
+        response_2 = self.guest_client.get(reverse('posts:index'))
+        self.assertNotEqual(response_1.content, response_2.content)
+        self.assertIn(new_post, response_2.context['page_obj'])
+        with run_on_commit:
+            new_post.delete()
+        response_3 = self.guest_client.get(reverse('posts:index'))
+        self.assertNotIn(new_post, response_3.context['page_obj'])
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -206,3 +267,983 @@ class PaginatorViewsTest(TestCase):
                     self.assertEqual(
                         len(response.context['page_obj']), page_count[1]
                     )
+
+    def test_keyset_pagination(self):
+        '''Курсорная пагинация идёт по (pub_date, id) без COUNT'''
+        cache.clear()
+        for url, page_count in self.pages:
+            with self.subTest(url=url):
+                response = self.client.get(url + '?after=')
+                page_obj = response.context['page_obj']
+                self.assertTrue(page_obj.keyset)
+                self.assertEqual(len(page_obj), page_count[0])
+                self.assertFalse(page_obj.has_previous())
+                response = self.client.get(
+                    url + f'?after={page_obj.next_cursor}'
+                )
+                next_page = response.context['page_obj']
+                self.assertEqual(len(next_page), page_count[1])
+                self.assertFalse(next_page.has_next())
+                # «Первая» ведёт на первую страницу без смены пагинации
+                self.assertContains(response, 'href="?after="')
+                self.assertEqual(
+                    [post.pk for post in list(page_obj) + list(next_page)],
+                    list(
+                        Post.objects.order_by('-pub_date', '-pk')
+                        .values_list('pk', flat=True)
+                    ),
+                )
+                response = self.client.get(
+                    url + f'?before={next_page.previous_cursor}'
+                )
+                self.assertEqual(
+                    list(response.context['page_obj']), list(page_obj)
+                )
+
+    def test_keyset_pagination_without_count(self):
+        '''Страница по курсору строится одним запросом'''
+        request = RequestFactory().get('/', {'after': ''})
+        with self.assertNumQueries(1):
+            page_obj = make_page(request, Post.objects.all())
+            self.assertEqual(len(page_obj), settings.NUMBER_OF_POSTS)
+
+    def test_broken_cursor(self):
+        '''Битый или огромный курсор даёт первую страницу, а не 500'''
+        cache.clear()
+        cursors = (
+            'x_1', '1', f'{10 ** 30}_1', f'-{10 ** 30}_1', f'0_{10 ** 30}',
+        )
+        for url, page_count in self.pages:
+            for name in ('after', 'before'):
+                for cursor in cursors:
+                    with self.subTest(url=url, name=name, cursor=cursor):
+                        response = self.client.get(url, {name: cursor})
+                        page_obj = response.context['page_obj']
+                        self.assertEqual(len(page_obj), page_count[0])
+                        self.assertFalse(page_obj.has_previous())
+
+    @override_settings(NUMBER_OF_POSTS=2, PAGINATOR_COUNT_LIMIT=5)
+    def test_bounded_count_pages(self):
+        '''Без счётчика посты считаются только на несколько страниц вперёд'''
+        page_obj = make_page(RequestFactory().get('/'), Post.objects.all())
+        self.assertFalse(page_obj.paginator.exact_count)
+        self.assertEqual(page_window(page_obj), [1, 2, 3, None])
+        self.assertEqual(count_label(page_obj.paginator), '6+')
+        request = RequestFactory().get('/', {'page': 5})
+        page_obj = make_page(request, Post.objects.all())
+        self.assertEqual(page_obj.number, 5)
+        self.assertTrue(page_obj.has_next())
+        self.assertEqual(page_window(page_obj), [1, None, 3, 4, 5, 6, 7])
+        self.assertTrue(page_obj.paginator.exact_count)
+        response = self.client.get(reverse('posts:index'), {'page': 3})
+        self.assertNotContains(response, 'Последняя')
+        self.assertContains(response, '…')
+
+    def test_huge_page_number(self):
+        '''Огромный номер страницы даёт последнюю страницу, а не 500'''
+        cache.clear()
+        for url, page_count in self.pages:
+            with self.subTest(url=url):
+                response = self.client.get(url, {'page': '9' * 30})
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj), page_count[1])
+                self.assertFalse(page_obj.has_next())
+
+
+class PostListCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Другое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Пост в группе',
+            group=cls.group,
+        )
+        # Адрес ленты и число запросов при попадании в кеш
+        cls.cached_queries = (
+            (reverse('posts:group_list', kwargs={'slug': cls.group.slug}), 1),
+            (reverse('posts:profile', kwargs={'username': cls.author}), 1),
+        )
+        cls.urls = tuple(url for url, _ in cls.cached_queries)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_list_served_from_cache(self):
+        '''Повторный запрос ленты не читает посты из базы'''
+        for url, queries in self.cached_queries:
+            with self.subTest(url=url):
+                self.client.get(url)
+                # Только группа или автор, без постов ленты и её COUNT
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url)
+                self.assertContains(response, self.post.text)
+
+    def test_post_list_invalidation(self):
+        '''Ленты сбрасываются при создании, правке и удалении поста'''
+        for url in self.urls:
+            self.client.get(url)
+        with run_on_commit:
+            post = Post.objects.create(
+                author=self.author,
+                text='Новый пост в группе',
+                group=self.group,
+            )
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), post.text)
+        post.group = self.other_group
+        with run_on_commit:
+            post.save()
+        self.assertNotContains(self.client.get(self.urls[0]), post.text)
+        self.assertContains(
+            self.client.get(
+                reverse(
+                    'posts:group_list',
+                    kwargs={'slug': self.other_group.slug},
+                )
+            ),
+            post.text,
+        )
+        with run_on_commit:
+            post.delete()
+        self.assertNotContains(self.client.get(self.urls[1]), post.text)
+
+    def test_author_rename_invalidates_lists(self):
+        '''Новое имя автора сразу видно на главной и в ленте группы'''
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        )
+        versions = [
+            get_version('index_page'), get_version('group', self.group.pk)
+        ]
+        # Вход меняет только last_login: кеш не сбрасывается
+        self.author.last_login = timezone.now()
+        self.author.save(update_fields=['last_login'])
+        self.assertEqual(
+            [get_version('index_page'), get_version('group', self.group.pk)],
+            versions,
+        )
+        for url in urls:
+            self.client.get(url)
+        self.author.first_name = 'Переименованный'
+        with run_on_commit:
+            self.author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Переименованный')
+
+    def test_commenter_rename_invalidates_post(self):
+        '''Новое имя комментатора сразу видно на странице поста'''
+        commenter = User.objects.create_user(username='commenter')
+        Comment.objects.create(
+            post=self.post, author=commenter, text='Комментарий'
+        )
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        etag = self.client.get(url)['ETag']
+        commenter.username = 'renamed'
+        with run_on_commit:
+            commenter.save()
+        self.assertContains(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'renamed'
+        )
+
+    def test_versions_bumped_after_commit(self):
+        '''Версии меняются ещё раз после фиксации транзакции'''
+        callbacks = []
+        with mock.patch(
+            'django.db.transaction.on_commit',
+            lambda func, using=None: callbacks.append(func),
+        ):
+            Post.objects.create(author=self.author, text='Пост')
+        # Кешированное до фиксации не должно пережить её
+        version = get_version('author', self.author.pk)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version('author', self.author.pk), version)
+
+    def test_long_cache_not_sent_to_browser(self):
+        '''Срок серверного кеша не попадает в заголовки ответа'''
+        view = versioned_cache_page(3600, 'browser')(
+            lambda request: HttpResponse('страница')
+        )
+        for attempt in ('промах', 'попадание'):
+            with self.subTest(attempt=attempt):
+                response = view(RequestFactory().get('/browser/'))
+                self.assertFalse(response.has_header('Expires'))
+                self.assertIn('max-age=0', response['Cache-Control'])
+                self.assertIn('private', response['Cache-Control'])
+
+
+class CacheStampedeTest(SimpleTestCase):
+    CLIENTS = 500
+
+    def setUp(self):
+        cache.clear()
+        self.renders = 0
+        self.request = RequestFactory().get('/stampede/')
+
+        @coalesced_cache_page(60, 'stampede')
+        def view(request):
+            self.renders += 1
+            time.sleep(0.2)
+            return HttpResponse(f'render {self.renders}')
+
+        self.view = view
+
+    def hit_concurrently(self):
+        barrier = threading.Barrier(self.CLIENTS)
+        responses = []
+
+        def client():
+            barrier.wait()
+            responses.append(self.view(self.request))
+
+        threads = [
+            threading.Thread(target=client) for _ in range(self.CLIENTS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(responses), self.CLIENTS)
+        return {response.content for response in responses}
+
+    def test_long_cache_not_sent_to_browser(self):
+        '''Срок серверного кеша не попадает в заголовки ответа'''
+        for attempt in ('промах', 'попадание'):
+            with self.subTest(attempt=attempt):
+                response = self.view(self.request)
+                self.assertFalse(response.has_header('Expires'))
+                self.assertIn('max-age=0', response['Cache-Control'])
+        self.assertEqual(self.renders, 1)
+
+    def test_single_render_on_miss(self):
+        """Одновременные промахи ждут одну перерисовку."""
+        self.assertEqual(self.hit_concurrently(), {b'render 1'})
+        self.assertEqual(self.renders, 1)
+
+    def test_late_lock_uses_stored_page(self):
+        """Опоздавший к блокировке запрос не перерисовывает страницу."""
+        self.view(self.request)
+        key = page_cache_key(
+            self.request, 'stampede', get_version('stampede')
+        )
+        entry = cache.get(key)
+        cache.delete(key)
+        add = cache.add
+
+        def late_add(*args, **kwargs):
+            # Прежний держатель блокировки успел сохранить страницу
+            cache.set(key, entry, 60)
+            return add(*args, **kwargs)
+
+        with mock.patch.object(cache, 'add', late_add):
+            response = self.view(self.request)
+        self.assertEqual(response.content, b'render 1')
+        self.assertEqual(self.renders, 1)
+
+    def test_single_render_on_expiry(self):
+        """Истёкшая страница отдаётся, пока один запрос её обновляет."""
+        self.view(self.request)
+        key = page_cache_key(
+            self.request, 'stampede', get_version('stampede')
+        )
+        response, delta, _ = cache.get(key)
+        cache.set(key, (response, delta, time.time() - 1), 60)
+        self.assertLessEqual(
+            self.hit_concurrently(), {b'render 1', b'render 2'}
+        )
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(self.view(self.request).content, b'render 2')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class FeedIndexesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый пост', group=cls.group
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.author, text='Комментарий'
+        )
+        # Адрес, таблица и индекс, которым должен читаться её запрос
+        cls.feeds = (
+            (
+                reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+                'posts_post',
+                'post_group_pub_date_idx',
+            ),
+            (
+                reverse('posts:profile', kwargs={'username': cls.author}),
+                'posts_post',
+                'post_author_pub_date_idx',
+            ),
+            (
+                reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+                'posts_comment',
+                'comment_post_created_idx',
+            ),
+        )
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_feeds_use_composite_indexes(self):
+        '''Ленты читаются составным индексом без временного дерева'''
+        for query in ('', '?after='):
+            for url, table, index in self.feeds:
+                with self.subTest(url=url + query):
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as context:
+                        self.client.get(url + query)
+                    plans = [
+                        self.explain(captured['sql'])
+                        for captured in context.captured_queries
+                        if captured['sql'].startswith('SELECT')
+                        and f'FROM "{table}"' in captured['sql']
+                        and 'ORDER BY' in captured['sql']
+                    ]
+                    self.assertTrue(plans)
+                    for plan in plans:
+                        self.assertIn(index, plan)
+                        self.assertNotIn('TEMP B-TREE', plan)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Author')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.get(pk=self.post.pk)
+
+    def test_image_change_schedules_thumbnails(self):
+        '''Миниатюры ставятся в очередь только при смене картинки'''
+        with mock.patch('posts.signals.schedule_thumbnails') as schedule:
+            self.post.text = 'Новый текст'
+            self.post.save()
+            schedule.assert_not_called()
+            buffer = io.BytesIO()
+            Image.new('RGB', (2, 1), 'red').save(buffer, format='GIF')
+            self.post.image = SimpleUploadedFile(
+                name='other.gif',
+                content=buffer.getvalue(),
+                content_type='image/gif',
+            )
+            self.post.save()
+            schedule.assert_called_once_with(self.post.pk, on_commit=True)
+
+    def test_request_does_not_build_thumbnails(self):
+        '''Запрос страницы не строит миниатюру, а отдаёт её из готовых'''
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with mock.patch('posts.thumbnails.enqueue') as enqueue:
+            response = self.client.get(url)
+        enqueue.assert_called_once_with(generate_thumbnails, self.post.pk)
+        self.assertContains(response, self.post.image.url)
+        generate_thumbnails(self.post.pk)
+        thumbnail = lookup_thumbnail(self.post.image)
+        self.assertIsNotNone(thumbnail)
+        self.assertTrue(thumbnail.exists())
+        with mock.patch('posts.thumbnails.get_thumbnail') as get:
+            response = self.client.get(url)
+        get.assert_not_called()
+        self.assertContains(response, thumbnail.url)
+
+    def test_image_normalized_with_srcset_variants(self):
+        '''Оригинал теряет метаданные, страница получает srcset WebP/JPEG'''
+        exif = Image.Exif()
+        exif[0x010F] = 'Камера'
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(
+            buffer, format='JPEG', exif=exif.tobytes()
+        )
+        post = Post.objects.create(
+            author=self.author,
+            text='Пост с EXIF',
+            image=SimpleUploadedFile('exif.jpg', buffer.getvalue()),
+        )
+        generate_thumbnails(post.pk)
+        post.refresh_from_db()
+        self.assertTrue(post.image_processed)
+        with Image.open(post.image) as image:
+            self.assertNotIn('exif', image.info)
+        [post] = attach_thumbnails([post])
+        self.assertEqual(
+            [source['type'] for source in post.sources],
+            list(settings.POST_THUMBNAIL_SRCSET['feed']),
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        for source in post.sources:
+            self.assertIn('480w', source['srcset'])
+            self.assertContains(response, source['srcset'])
+        self.assertContains(response, post.thumbnail.url)
+
+    @override_settings(BACKGROUND_TASKS_SYNC=True)
+    def test_failed_thumbnails_not_rescheduled(self):
+        '''Картинка, которую не удалось обработать, не ставится повторно'''
+        with mock.patch(
+            'posts.thumbnails.get_thumbnail', side_effect=OSError('битая')
+        ), self.assertLogs('core.tasks', 'ERROR'):
+            schedule_thumbnails(self.post.pk)
+        with mock.patch('posts.thumbnails.enqueue') as enqueue:
+            self.assertIsNone(lookup_thumbnail(self.post.image))
+            attach_thumbnails([self.post])
+            enqueue.assert_not_called()
+        # Новая картинка - новая попытка
+        with run_on_commit:
+            schedule_thumbnails(self.post.pk, on_commit=True)
+        self.assertIsNotNone(lookup_thumbnail(self.post.image))
+
+    @override_settings(BACKGROUND_TASKS_SYNC=True, MEDIA_GRACE_PERIOD=0)
+    def test_duplicate_images_share_file(self):
+        '''Одинаковые картинки хранятся одним файлом с общими миниатюрами'''
+        buffer = io.BytesIO()
+        Image.new('RGB', (3, 1), 'blue').save(buffer, format='GIF')
+        first, duplicate = (
+            Post.objects.create(
+                author=self.author,
+                text='Тот же мем',
+                image=SimpleUploadedFile(name, buffer.getvalue()),
+            )
+            for name in ('meme.gif', 'copy.GIF')
+        )
+        self.assertEqual(duplicate.image.name, first.image.name)
+        self.assertRegex(first.image.name, r'^posts/\w\w/\w{64}\.gif$')
+        generate_thumbnails(first.pk)
+        duplicate.refresh_from_db()
+        self.assertTrue(duplicate.image_processed)
+        with mock.patch('posts.thumbnails.get_thumbnail') as get:
+            thumbnail = lookup_thumbnail(duplicate.image)
+        get.assert_not_called()
+        self.assertTrue(thumbnail.exists())
+        image = first.image
+        with run_on_commit:
+            first.delete()
+            self.assertTrue(image.storage.exists(image.name))
+            duplicate.delete()
+        self.assertFalse(image.storage.exists(image.name))
+        self.assertFalse(thumbnail.exists())
+
+    @override_settings(BACKGROUND_TASKS_SYNC=True)
+    def test_attach_thumbnails_batch(self):
+        '''Миниатюры страницы ищутся одним запросом при любом числе постов'''
+        for number in range(settings.NUMBER_OF_POSTS - 1):
+            Post.objects.create(
+                author=self.author,
+                text=f'Пост {number}',
+                image=SimpleUploadedFile(
+                    name=f'batch{number}.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif',
+                ),
+            )
+        posts = list(Post.objects.all())
+        attach_thumbnails(posts)
+        cache.clear()
+        with self.assertNumQueries(1):
+            posts = attach_thumbnails(posts)
+        self.assertEqual(len(posts), settings.NUMBER_OF_POSTS)
+        for post in posts:
+            self.assertEqual(
+                post.thumbnail.name, lookup_thumbnail(post.image).name
+            )
+        # Дальше ответ целиком из кеша
+        with self.assertNumQueries(0):
+            attach_thumbnails(posts)
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Commentator')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.author, text=f'Коммент {i}')
+            for i in range(7)
+        )
+        cls.expected = list(
+            Comment.objects.filter(post=cls.post).order_by('-created', '-pk')
+        )
+
+    def test_post_detail_shows_first_batch(self):
+        '''На странице поста только первая порция комментариев'''
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.expected[:3])
+        self.assertTrue(comments.has_next())
+        self.assertContains(
+            response,
+            reverse('posts:post_comments', args=(self.post.pk,))
+            + f'?after={comments.next_cursor}',
+        )
+
+    def test_comments_fragment_batches(self):
+        '''Фрагмент и JSON отдают следующие порции до конца'''
+        url = reverse('posts:post_comments', args=(self.post.pk,))
+        response = self.client.get(url)
+        batch = list(response.context['comments'])
+        self.assertEqual(batch, self.expected[:3])
+        collected = []
+        next_url = url + '?format=json'
+        while next_url:
+            data = self.client.get(next_url).json()
+            collected.extend(item['id'] for item in data['comments'])
+            next_url = data['next']
+        self.assertEqual(collected, [c.pk for c in self.expected])
+
+    def test_comments_fragment_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk + 100,))
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Etag')
+        cls.group = Group.objects.create(
+            title='Группа', slug='etag', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.author}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        '''Повторный запрос с тем же ETag получает 304 без тела'''
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_etag_changes_with_content(self):
+        '''Новый комментарий или пост меняет ETag всех затронутых страниц'''
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        with run_on_commit:
+            Comment.objects.create(
+                post=self.post, author=self.author, text='К'
+            )
+            Post.objects.create(
+                author=self.author, group=self.group, text='Ещё'
+            )
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_user(self):
+        anonymous = [self.client.get(url)['ETag'] for url in self.urls]
+        self.client.force_login(self.author)
+        for url, etag in zip(self.urls, anonymous):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+
+ATOM_ENTRY = '{http://www.w3.org/2005/Atom}entry'
+ATOM_LINK = '{http://www.w3.org/2005/Atom}link'
+
+
+class FeedsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Feeder')
+        cls.group = Group.objects.create(
+            title='Группа', slug='feeds', description='Описание'
+        )
+        for number in range(5):
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {number}'
+            )
+        cls.posts = list(Post.objects.order_by('-pub_date', '-pk'))
+
+    def setUp(self):
+        cache.clear()
+
+    def read(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_xml_feeds(self):
+        '''RSS и Atom всех лент отдаются потоком и содержат посты'''
+        urls = (
+            ('posts:index_feed', ()),
+            ('posts:group_feed', (self.group.slug,)),
+            ('posts:profile_feed', (self.author.username,)),
+        )
+        for name, args in urls:
+            for fmt, tag in (('rss', 'item'), ('atom', ATOM_ENTRY)):
+                with self.subTest(name=name, fmt=fmt):
+                    root = ElementTree.fromstring(
+                        self.read(reverse(name, args=args + (fmt,)))
+                    )
+                    self.assertEqual(
+                        len(list(root.iter(tag))), len(self.posts)
+                    )
+
+    def test_xml_feeds_next_link(self):
+        '''RSS и Atom листаются по ссылке rel="next" до конца ленты'''
+        for fmt, tag in (('rss', 'item'), ('atom', ATOM_ENTRY)):
+            with self.subTest(fmt=fmt):
+                url, params, count = (
+                    reverse('posts:index_feed', args=(fmt,)), {'limit': 2}, 0
+                )
+                while url:
+                    root = ElementTree.fromstring(self.read(url, **params))
+                    count += len(list(root.iter(tag)))
+                    links = [
+                        link.get('href') for link in root.iter(ATOM_LINK)
+                        if link.get('rel') == 'next'
+                    ]
+                    url, params = (links or [None])[0], {}
+                self.assertEqual(count, len(self.posts))
+
+    def test_json_feed_cursors(self):
+        '''JSON-фид листается по next_url, а ?since= отдаёт новые посты'''
+        url = reverse('posts:index_feed', args=('json',))
+        data = json.loads(self.read(url, limit=2))
+        ids = [item['id'] for item in data['items']]
+        while data['next_url']:
+            data = json.loads(self.read(data['next_url']))
+            ids += [item['id'] for item in data['items']]
+        self.assertEqual(len(ids), len(self.posts))
+        self.assertTrue(ids[0].endswith(f'/posts/{self.posts[0].pk}/'))
+
+        newest = self.posts[0]
+        cursor = encode_cursor(newest.pub_date, newest.pk)
+        data = json.loads(self.read(url, since=cursor))
+        self.assertEqual(data['items'], [])
+        self.assertIsNone(data['next_url'])
+        post = Post.objects.create(author=self.author, text='Новый')
+        data = json.loads(self.read(url, since=cursor))
+        self.assertEqual(len(data['items']), 1)
+        self.assertTrue(data['items'][0]['id'].endswith(f'/{post.pk}/'))
+
+    def test_feed_not_modified(self):
+        url = reverse('posts:group_feed', args=(self.group.slug, 'rss'))
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('posts:index_feed', args=('x',)))
+        self.assertEqual(response.status_code, 404)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='Seeker', is_staff=True, is_superuser=True
+        )
+        cls.match = Post.objects.create(
+            author=cls.author, text='Ёжик в тумане ищет лошадку'
+        )
+        cls.better = Post.objects.create(
+            author=cls.author, text='Ёжик, ёжик и туманы'
+        )
+        Post.objects.create(author=cls.author, text='Про медвежонка')
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+
+    def test_search_ranked(self):
+        '''Находятся посты со всеми словами запроса, лучшие первыми'''
+        page = self.search('ёжик туман').context['page_obj']
+        self.assertEqual(page.paginator.count, 2)
+        self.assertEqual(list(page), [self.better, self.match])
+        page = self.search('лошадку').context['page_obj']
+        self.assertEqual(list(page), [self.match])
+
+    def test_index_follows_changes(self):
+        '''Индекс обновляется при правке и удалении постов'''
+        post = Post.objects.get(pk=self.match.pk)
+        post.text = 'Совсем другой текст'
+        post.save()
+        Post.objects.filter(pk=self.better.pk).update(text='Опять другой')
+        self.assertEqual(len(self.search('ёжик').context['page_obj']), 0)
+        self.assertEqual(len(self.search('другой').context['page_obj']), 2)
+        post.delete()
+        self.assertEqual(len(self.search('другой').context['page_obj']), 1)
+
+    def test_search_syntax_is_escaped(self):
+        for query in ('"', 'ёжик OR', 'NEAR(', '*', ''):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query).status_code, 200)
+
+    @override_settings(NUMBER_OF_POSTS=1)
+    def test_search_pagination_keeps_query(self):
+        response = self.search('ёжик')
+        self.assertContains(
+            response, 'href="?q=%D1%91%D0%B6%D0%B8%D0%BA&page=2"'
+        )
+        page = self.search('ёжик', page=2).context['page_obj']
+        self.assertEqual(list(page), [self.match])
+
+    def test_admin_search(self):
+        self.client.force_login(self.author)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'туман'}
+        )
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {self.match, self.better},
+        )
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='Admin', is_staff=True, is_superuser=True
+        )
+        cls.groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'adm-{i}')
+            for i in range(3)
+        ]
+
+    def create_posts(self, number):
+        Post.objects.bulk_create(
+            Post(
+                author=self.admin,
+                group=self.groups[i % len(self.groups)],
+                text=f'Пост {i}',
+            )
+            for i in range(number)
+        )
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow(self):
+        '''Число запросов списка постов не зависит от числа строк'''
+        self.client.force_login(self.admin)
+        self.create_posts(2)
+        few = self.changelist_queries()
+        self.create_posts(30)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_group_column_is_autocomplete(self):
+        self.client.force_login(self.admin)
+        self.create_posts(1)
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertContains(response, 'admin-autocomplete')
+        # В строке только выбранная группа, а не весь список
+        self.assertNotContains(response, self.groups[1].title)
+
+    def test_bounded_count_paginator(self):
+        self.create_posts(12)
+        paginator = BoundedCountPaginator(
+            Post.objects.all(), 5, count_limit=20
+        )
+        self.assertEqual(paginator.count, 12)
+        self.assertTrue(paginator.exact_count)
+        paginator = EstimatedCountPaginator(
+            Post.objects.all(), 5, count_limit=10
+        )
+        self.assertEqual(paginator.count, Post.objects.latest('pk').pk)
+        self.assertFalse(paginator.exact_count)
+        paginator = BoundedCountPaginator(
+            Post.objects.filter(group=self.groups[0]), 2, count_limit=3
+        )
+        self.assertEqual(paginator.count, 3)
+        self.assertFalse(paginator.exact_count)
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class FollowTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.celebrity = User.objects.create_user(username='celebrity')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(
+            author=cls.author, text='Пост до подписки'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def follow(self, author):
+        return self.client.post(
+            reverse('posts:profile_follow', args=(author.username,))
+        )
+
+    def feed(self, query=''):
+        response = self.client.get(reverse('posts:follow_index') + query)
+        return response.context['page_obj']
+
+    def test_follow_and_unfollow(self):
+        """Подписка заполняет ленту и счётчик, отписка их очищает."""
+        self.follow(self.author)
+        self.follow(self.author)
+        self.follow(self.reader)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(
+            AuthorCounter.objects.get(author=self.author).followers_count, 1
+        )
+        self.assertEqual(list(self.feed()), [self.old_post])
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,))
+        )
+        self.assertTrue(response.context['following'])
+        self.assertEqual(response.context['followers_count'], 1)
+        self.assertContains(
+            response,
+            'method="post" action="'
+            + reverse('posts:profile_unfollow', args=(self.author.username,)),
+        )
+        self.client.post(
+            reverse('posts:profile_unfollow', args=(self.author.username,))
+        )
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(
+            AuthorCounter.objects.get(author=self.author).followers_count, 0
+        )
+        self.assertEqual(list(self.feed()), [])
+
+    def test_new_posts_fanned_out(self):
+        """Новый пост попадает в ленты подписчиков и только в них."""
+        self.follow(self.author)
+        with run_on_commit:
+            post = Post.objects.create(author=self.author, text='Новый')
+            Post.objects.create(author=self.celebrity, text='Чужой')
+        self.assertEqual(list(self.feed()), [post, self.old_post])
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2
+        )
+
+    @override_settings(FOLLOW_FANOUT_LIMIT=1)
+    def test_pulled_authors_merged_on_read(self):
+        """Посты авторов без раскладки подмешиваются в ленту при чтении."""
+        Follow.objects.create(user=self.author, author=self.celebrity)
+        self.follow(self.author)
+        self.follow(self.celebrity)
+        with run_on_commit:
+            posts = [
+                Post.objects.create(
+                    author=(self.author, self.celebrity)[number % 2],
+                    text=f'Пост {number}',
+                )
+                for number in range(settings.NUMBER_OF_POSTS + 2)
+            ]
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.celebrity).exists()
+        )
+        expected = [self.old_post] + posts
+        expected.reverse()
+        first = self.feed()
+        self.assertEqual(list(first), expected[:settings.NUMBER_OF_POSTS])
+        second = self.feed(f'?after={first.next_cursor}')
+        self.assertEqual(list(second), expected[settings.NUMBER_OF_POSTS:])
+        self.assertFalse(second.has_next())
+        previous = self.feed(f'?before={second.previous_cursor}')
+        self.assertEqual(list(previous), list(first))
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+    def test_timeline_read_by_index(self):
+        """Лента читается диапазоном индекса при любом числе подписок."""
+        self.follow(self.author)
+        for query in ('', f'?after={encode_cursor(timezone.now(), 0)}'):
+            with CaptureQueriesContext(connection) as context:
+                self.feed(query)
+            sql = next(
+                captured['sql'] for captured in context.captured_queries
+                if 'FROM "posts_timelineentry"' in captured['sql']
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('timeline_user_pub_date_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_follow_pages_require_login(self):
+        self.client.logout()
+        for name, args, method in (
+            ('posts:follow_index', (), 'get'),
+            ('posts:profile_follow', (self.author.username,), 'post'),
+            ('posts:profile_unfollow', (self.author.username,), 'post'),
+        ):
+            with self.subTest(name=name):
+                response = getattr(self.client, method)(
+                    reverse(name, args=args)
+                )
+                self.assertRedirects(
+                    response,
+                    reverse('users:login') + '?next='
+                    + reverse(name, args=args),
+                )
+        self.assertFalse(Follow.objects.exists())
+
+    def test_follow_requires_post(self):
+        """GET-запрос (картинка, предзагрузка ссылки) не меняет подписки."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        for name in ('posts:profile_follow', 'posts:profile_unfollow'):
+            with self.subTest(name=name):
+                response = self.client.get(
+                    reverse(name, args=(self.author.username,))
+                )
+                self.assertEqual(response.status_code, 405)
+        self.assertTrue(Follow.objects.exists())
@@ -0,0 +1,217 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from core.tasks import enqueue
+
+from .cache import bump_version
+from .images import normalize_original
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+FAILURE_KEY_PREFIX = 'posts_thumbnails_failed'
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _thumbnail_options(source, options):
+    """Дополняет опции так же, как sorl перед построением имени файла."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_file(image, alias):
+    """Файл миниатюры alias для картинки image, без обращения к хранилищу."""
+    geometry, options = settings.POST_THUMBNAILS[alias]
+    source = ImageFile(image)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _thumbnail_options(source, options)
+    )
+    return ImageFile(name, default.storage)
+
+
+def failure_key(post_id):
+    return f'{FAILURE_KEY_PREFIX}:{post_id}'
+
+
+def generate_thumbnails(post_id):
+    """Строит все миниатюры POST_THUMBNAILS для картинки поста.
+
+    Новая картинка перед этим пересохраняется (см. normalize_original),
+    если тот же файл не обработан раньше для другого поста; после - все
+    посты с этим файлом помечаются как обработанные: файл и миниатюры
+    у них общие. Неудача запоминается на POST_THUMBNAILS_RETRY_TIMEOUT
+    секунд, и всё это время построение больше не ставится в очередь:
+    иначе битая картинка декодировалась бы заново при каждом показе.
+    """
+    try:
+        post = Post.objects.filter(pk=post_id).first()
+        if post is None or not post.image:
+            return
+        posts = Post.objects.filter(image=post.image.name)
+        if not posts.filter(image_processed=True).exists():
+            normalize_original(post)
+        for geometry, options in settings.POST_THUMBNAILS.values():
+            get_thumbnail(post.image, geometry, **options)
+        posts.update(image_processed=True)
+        # Пока миниатюры строились, страницы могли попасть в кеш
+        # с исходной картинкой
+        bump_version('index_page')
+        for pk, author_id, group_id in posts.values_list(
+            'pk', 'author_id', 'group_id'
+        ):
+            bump_version('post', pk)
+            bump_version('author', author_id)
+            if group_id is not None:
+                bump_version('group', group_id)
+    except Exception:
+        cache.set(
+            failure_key(post_id), True, settings.POST_THUMBNAILS_RETRY_TIMEOUT
+        )
+        raise
+    finally:
+        with _pending_lock:
+            _pending.discard(post_id)
+
+
+def schedule_thumbnails(post_id, on_commit=False):
+    """Ставит построение миниатюр поста в фоновую очередь один раз.
+
+    С on_commit задача ставится после фиксации транзакции, когда
+    картинка и пост уже видны фоновому потоку; так ставится построение
+    для новой картинки, и прежняя неудача забывается. Иначе пост,
+    построение для которого недавно упало, пропускается.
+    """
+    if on_commit:
+        cache.delete(failure_key(post_id))
+        transaction.on_commit(lambda: schedule_thumbnails(post_id))
+        return
+    if cache.get(failure_key(post_id)):
+        return
+    with _pending_lock:
+        if post_id in _pending:
+            return
+        _pending.add(post_id)
+    enqueue(generate_thumbnails, post_id)
+
+
+def lookup_thumbnail(image, alias='feed'):
+    """Готовая миниатюра картинки поста или None.
+
+    Запрос страницы миниатюры не строит: если её ещё нет, построение
+    ставится в фоновую очередь.
+    """
+    if not image:
+        return None
+    try:
+        thumbnail = default.kvstore.get(thumbnail_file(image, alias))
+    except Exception:
+        logger.exception('Не удалось найти миниатюру %s', image)
+        return None
+    if thumbnail is None and image.instance.pk is not None:
+        schedule_thumbnails(image.instance.pk)
+        if settings.BACKGROUND_TASKS_SYNC:
+            return default.kvstore.get(thumbnail_file(image, alias))
+    return thumbnail
+
+
+def _get_raw_many(keys):
+    """Значения ключей хранилища sorl одним get_many и одним запросом.
+
+    Повторяет логику cached_db KVStore._get_raw, но для всех ключей
+    сразу; другие хранилища опрашиваются по одному ключу.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, cached_db_kvstore.KVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = set(keys) - set(values)
+    if missing:
+        found = dict(
+            KVStore.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        # Как и sorl, запоминаем и отсутствие ключа
+        kvstore.cache.set_many(
+            {
+                key: found.get(key, cached_db_kvstore.EMPTY_VALUE)
+                for key in missing
+            },
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+        values.update(found)
+    return {
+        key: value for key, value in values.items()
+        if value != cached_db_kvstore.EMPTY_VALUE
+    }
+
+
+def attach_thumbnails(posts, alias='feed'):
+    """Подставляет post.thumbnail и post.sources всем постам страницы разом.
+
+    В post.thumbnail попадает готовая миниатюра, а пока её нет -
+    исходная картинка (построение ставится в очередь). post.sources -
+    варианты для <source srcset> по типам из POST_THUMBNAIL_SRCSET,
+    только полностью построенные. Число обращений к хранилищу не
+    зависит от числа постов.
+    """
+    posts = list(posts)
+    srcset = settings.POST_THUMBNAIL_SRCSET.get(alias, {})
+    aliases = {alias}.union(*srcset.values())
+    keys = {}
+    for post in posts:
+        post.thumbnail, post.sources = None, []
+        if post.image:
+            keys[post.pk] = {
+                name: add_prefix(thumbnail_file(post.image, name).key)
+                for name in aliases
+            }
+    values = _get_raw_many(
+        [key for names in keys.values() for key in names.values()]
+    ) if keys else {}
+    for post in posts:
+        if not post.image:
+            continue
+        found = {
+            name: deserialize_image_file(values[key])
+            for name, key in keys[post.pk].items()
+            if values.get(key)
+        }
+        if alias not in found:
+            post.thumbnail = lookup_thumbnail(post.image, alias) or post.image
+            continue
+        post.thumbnail = found[alias]
+        for content_type, names in srcset.items():
+            if all(name in found for name in names):
+                post.sources.append({
+                    'type': content_type,
+                    'srcset': ', '.join(
+                        f'{found[name].url} {found[name].width}w'
+                        for name in names
+                    ),
+                })
+            else:
+                schedule_thumbnails(post.pk)
+    return posts
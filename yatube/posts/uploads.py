@@ -0,0 +1,170 @@
+import os
+import re
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import locks
+from django.core.files.uploadedfile import UploadedFile
+
+from .images import read_header
+
+# Возобновляемая загрузка картинки частями. Клиент создаёт загрузку
+# с полным размером файла, шлёт части PUT-запросами с заголовком
+# Content-Range и после обрыва спрашивает, сколько байт уже принято.
+# Части дописываются в файл UPLOAD_DIR прямо из потока запроса, поэтому
+# память не зависит от размера файла. Готовый файл передаётся в
+# PostForm через поле upload_id.
+UPLOAD_KEY_PREFIX = 'posts_upload'
+# Сколько байт потока читается за раз
+COPY_BUFFER_SIZE = 64 * 1024
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    """Ошибка загрузки; status - HTTP-статус ответа."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _key(upload_id):
+    return f'{UPLOAD_KEY_PREFIX}:{upload_id}'
+
+
+def upload_path(upload_id):
+    return os.path.join(settings.UPLOAD_DIR, f'{upload_id}.part')
+
+
+def start_upload(user, name, size):
+    """Создаёт загрузку файла name размером size байт."""
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        raise UploadError('Недопустимый размер файла.', status=413)
+    upload = {
+        'id': uuid.uuid4().hex,
+        'user': user.pk,
+        'name': os.path.basename(name) or 'image',
+        'size': size,
+    }
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    open(upload_path(upload['id']), 'wb').close()
+    cache.set(_key(upload['id']), upload, settings.UPLOAD_EXPIRY)
+    return upload
+
+
+def get_upload(user, upload_id):
+    """Загрузка пользователя user или None."""
+    if not upload_id or not UPLOAD_ID.match(upload_id):
+        return None
+    upload = cache.get(_key(upload_id))
+    if upload is None or upload['user'] != user.pk:
+        return None
+    if not os.path.exists(upload_path(upload_id)):
+        return None
+    return upload
+
+
+def upload_offset(upload):
+    """Сколько байт загрузки уже принято."""
+    try:
+        return os.path.getsize(upload_path(upload['id']))
+    except OSError:
+        return 0
+
+
+def upload_status(upload):
+    offset = upload_offset(upload)
+    return {
+        'id': upload['id'],
+        'offset': offset,
+        'size': upload['size'],
+        'complete': offset == upload['size'],
+    }
+
+
+def discard_upload(upload):
+    cache.delete(_key(upload['id']))
+    try:
+        os.remove(upload_path(upload['id']))
+    except FileNotFoundError:
+        pass
+
+
+def _parse_range(upload, content_range):
+    """(начало, конец, размер) из заголовка Content-Range части."""
+    match = CONTENT_RANGE.match(content_range or '')
+    if match is None:
+        raise UploadError('Нужен заголовок Content-Range.')
+    start, end, total = (int(group) for group in match.groups())
+    if total != upload['size'] or end < start or end >= total:
+        raise UploadError('Неверный Content-Range.', status=416)
+    return start, end, total
+
+
+def write_chunk(upload, content_range, stream):
+    """Дописывает часть из stream; content_range - заголовок запроса.
+
+    Часть должна начинаться с уже принятого смещения, иначе UploadError
+    со статусом 409: клиент узнаёт смещение и продолжает с него.
+    Последняя часть проверяется по заголовку картинки.
+    """
+    start, end, total = _parse_range(upload, content_range)
+    remaining = end - start + 1
+    with open(upload_path(upload['id']), 'ab') as file:
+        # Повтор части может прийти, пока первая попытка ещё пишется:
+        # смещение проверяется и дописывается под блокировкой файла
+        locks.lock(file, locks.LOCK_EX)
+        try:
+            if start != os.fstat(file.fileno()).st_size:
+                raise UploadError('Часть не с того места.', status=409)
+            while remaining:
+                chunk = stream.read(min(COPY_BUFFER_SIZE, remaining))
+                if not chunk:
+                    break
+                file.write(chunk)
+                remaining -= len(chunk)
+        finally:
+            file.flush()
+            locks.unlock(file)
+    if remaining:
+        # Обрыв посреди части: принятое остаётся, клиент продолжит
+        raise UploadError('Часть получена не полностью.')
+    if end + 1 == total:
+        try:
+            read_header(upload_path(upload['id']))
+        except forms.ValidationError as error:
+            discard_upload(upload)
+            raise UploadError(' '.join(error.messages))
+
+
+class CompletedUpload(UploadedFile):
+    """Собранный файл загрузки.
+
+    Как и TemporaryUploadedFile, отдаёт путь к файлу, поэтому
+    FileSystemStorage переносит его на место, а не копирует. Открытый
+    файл закрывает хранилище после переноса (см.
+    core.storage.ContentAddressedStorage.save).
+    """
+
+    def __init__(self, upload):
+        path = upload_path(upload['id'])
+        super().__init__(
+            open(path, 'rb'), upload['name'], None, upload['size']
+        )
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def completed_upload(user, upload_id):
+    """Файл законченной загрузки для формы, иначе ошибка валидации."""
+    upload = get_upload(user, upload_id)
+    if upload is None or not upload_status(upload)['complete']:
+        raise forms.ValidationError(
+            'Загрузка не найдена или не закончена.', code='invalid_upload'
+        )
+    return CompletedUpload(upload)
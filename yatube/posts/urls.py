@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 
 app_name = 'posts'
@@ -8,10 +8,44 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('feed/<str:fmt>/', feeds.index_feed, name='index_feed'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path(
+        'group/<slug:slug>/feed/<str:fmt>/',
+        feeds.group_feed,
+        name='group_feed',
+    ),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path(
+        'profile/<str:username>/feed/<str:fmt>/',
+        feeds.profile_feed,
+        name='profile_feed',
+    ),
+    path(
+        'profile/<str:username>/follow/',
+        views.profile_follow,
+        name='profile_follow',
+    ),
+    path(
+        'profile/<str:username>/unfollow/',
+        views.profile_unfollow,
+        name='profile_unfollow',
+    ),
+    path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
+    path('uploads/', views.upload_create, name='upload_create'),
+    path(
+        'uploads/<str:upload_id>/',
+        views.upload_detail,
+        name='upload_detail',
+    ),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments',
+    ),
     path('posts/<int:post_id>/comment/', views.add_comment, name='add_comment'),
 ]
@@ -1,8 +1,283 @@
+import datetime
+import sys
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, cached_property
+
+# GET-параметры курсорной пагинации
+CURSOR_AFTER = 'after'
+CURSOR_BEFORE = 'before'
+
+# Сколько номеров страниц показывать по обе стороны от текущей
+PAGE_WINDOW = 2
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def encode_cursor(moment, pk):
+    """Кодирует ключ (дата, id) в строку вида '<микросекунды>_<id>'."""
+    delta = moment - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 10 ** 6
+    return f'{micros + delta.microseconds}_{pk}'
+
+
+def decode_cursor(cursor):
+    """Разбирает курсор; для битого значения возвращает None."""
+    try:
+        micros, pk = (int(part) for part in cursor.split('_'))
+        # Дата за пределами datetime - тоже битый курсор
+        moment = EPOCH + datetime.timedelta(microseconds=micros)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+    if not -2 ** 63 <= pk < 2 ** 63:
+        # Не влезет в целое SQLite
+        return None
+    if not settings.USE_TZ:
+        moment = timezone.make_naive(moment, datetime.timezone.utc)
+    return moment, pk
+
+
+class KeysetPage(Page):
+    """Страница курсорной пагинации.
+
+    Номера страницы и общего количества объектов нет, есть только
+    курсоры на соседние страницы.
+    """
+    keyset = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Keyset page after {self.previous_cursor}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator(Paginator):
+    """Пагинация по ключу (дата, id) без COUNT и OFFSET.
+
+    Объекты отдаются по убыванию ключа, следующая страница выбирается
+    условием «ключ меньше последнего на текущей странице», поэтому
+    глубокие страницы стоят столько же, сколько первая. Вторая часть
+    ключа по умолчанию - pk, её меняет key_field.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 key_field='pk'):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+        self.key_field = key_field
+
+    def _cursor(self, obj):
+        return encode_cursor(
+            getattr(obj, self.date_field), getattr(obj, self.key_field)
+        )
+
+    def _first(self):
+        """Все объекты по убыванию ключа."""
+        return self.object_list.order_by(
+            f'-{self.date_field}', f'-{self.key_field}'
+        )
+
+    def _before(self, key):
+        """Объекты с ключом строго меньше key, по убыванию ключа."""
+        moment, pk = key
+        return self.object_list.filter(
+            **{f'{self.date_field}__lte': moment}
+        ).exclude(
+            **{self.date_field: moment, f'{self.key_field}__gte': pk}
+        ).order_by(f'-{self.date_field}', f'-{self.key_field}')
+
+    def _after(self, key):
+        """Объекты с ключом строго больше key, по возрастанию ключа."""
+        moment, pk = key
+        return self.object_list.filter(
+            **{f'{self.date_field}__gte': moment}
+        ).exclude(
+            **{self.date_field: moment, f'{self.key_field}__lte': pk}
+        ).order_by(self.date_field, self.key_field)
+
+    def iterator(self, after=None, since=None):
+        """До per_page объектов после курсора after или новее since.
 
+        После after объекты идут по убыванию ключа, как на страницах;
+        новее since - по возрастанию, для инкрементальной синхронизации.
+        Без курсоров (или с битым курсором) отдаётся начало выборки.
+        Объекты читаются потоком, страница в памяти не собирается.
+        """
+        since_key = decode_cursor(since)
+        after_key = decode_cursor(after)
+        if since_key is not None:
+            queryset = self._after(since_key)
+        elif after_key is not None:
+            queryset = self._before(after_key)
+        else:
+            queryset = self._first()
+        return queryset[:self.per_page].iterator(chunk_size=self.per_page)
 
-def make_page(request, posts):
-    paginator = Paginator(posts, settings.NUMBER_OF_POSTS)
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед before.
+
+        Без курсоров (или с битым курсором) отдаётся первая страница.
+        """
+        before_key = decode_cursor(before)
+        if before_key is not None:
+            objects = list(self._after(before_key)[:self.per_page + 1])
+            has_previous = len(objects) > self.per_page
+            objects = objects[:self.per_page][::-1]
+            if not objects:
+                return self.get_page()
+            return KeysetPage(
+                objects,
+                self,
+                next_cursor=self._cursor(objects[-1]),
+                previous_cursor=(
+                    self._cursor(objects[0]) if has_previous else None
+                ),
+            )
+        after_key = decode_cursor(after)
+        if after_key is not None:
+            queryset = self._before(after_key)
+        else:
+            queryset = self._first()
+        objects = list(queryset[:self.per_page + 1])
+        has_next = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        return KeysetPage(
+            objects,
+            self,
+            next_cursor=self._cursor(objects[-1]) if has_next else None,
+            previous_cursor=(
+                self._cursor(objects[0])
+                if after_key is not None and objects else None
+            ),
+        )
+
+
+class CountedPaginator(Paginator):
+    """Паджинатор с заранее известным числом объектов.
+
+    Число берётся из поддерживаемых счётчиков, поэтому COUNT(*) по
+    ленте не выполняется.
+    """
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        return self.known_count
+
+
+class BoundedCountPaginator(Paginator):
+    """Паджинатор, который считает объекты только до предела.
+
+    COUNT(*) по подзапросу с LIMIT останавливается на count_limit
+    строках (по умолчанию PAGINATOR_COUNT_LIMIT), и больше страниц, чем
+    помещается в предел, не показывается. exact_count показывает,
+    точное ли число.
+    """
+    # Оценивать ли число объектов сверх предела (см. estimate_count)
+    estimate = False
+
+    def __init__(self, object_list, per_page, *args, count_limit=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        if count_limit is None:
+            count_limit = settings.PAGINATOR_COUNT_LIMIT
+        self.count_limit = count_limit
+        self.exact_count = True
+
+    @cached_property
+    def count(self):
+        count = self.object_list.values('pk')[:self.count_limit + 1].count()
+        if count <= self.count_limit:
+            return count
+        self.exact_count = False
+        if self.estimate:
+            return max(self.estimate_count(), self.count_limit)
+        return self.count_limit
+
+    def estimate_count(self):
+        """Оценка для выборки без условий - максимальный id, иначе 0."""
+        if self.object_list.query.where:
+            return 0
+        return self.object_list.model._default_manager.aggregate(
+            last=Max('pk')
+        )['last'] or 0
+
+
+class EstimatedCountPaginator(BoundedCountPaginator):
+    """BoundedCountPaginator, оценивающий размер всей таблицы.
+
+    Для админки: страницы за оценкой могут оказаться пустыми, зато
+    доступна вся таблица.
+    """
+    estimate = True
+
+
+def bounded_count_limit(page_number, per_page):
+    """Предел счёта, при котором окно страниц вокруг текущей точное."""
+    try:
+        number = int(page_number)
+    except (TypeError, ValueError):
+        number = 1
+    # Предел (и LIMIT предел + 1) должен влезать в целое SQLite, дальше
+    # страниц всё равно нет и отдаётся последняя
+    number = min(number, sys.maxsize // per_page - PAGE_WINDOW - 1)
+    return max(
+        settings.PAGINATOR_COUNT_LIMIT, (number + PAGE_WINDOW) * per_page
+    )
+
+
+def make_page(request, posts, keyset=None, count=None):
+    """Страница постов для шаблона.
+
+    Курсорная пагинация включается настройкой KEYSET_PAGINATION,
+    аргументом keyset или курсором в запросе. Если число постов уже
+    известно по счётчику, его передают в count, иначе посты считаются
+    только до PAGINATOR_COUNT_LIMIT (и на несколько страниц вперёд от
+    текущей).
+    """
+    if keyset is None:
+        keyset = settings.KEYSET_PAGINATION or any(
+            name in request.GET for name in (CURSOR_AFTER, CURSOR_BEFORE)
+        )
+    if keyset:
+        paginator = KeysetPaginator(posts, settings.NUMBER_OF_POSTS)
+        return paginator.get_page(
+            after=request.GET.get(CURSOR_AFTER),
+            before=request.GET.get(CURSOR_BEFORE),
+        )
     page_number = request.GET.get('page')
+    if count is not None:
+        paginator = CountedPaginator(posts, settings.NUMBER_OF_POSTS, count)
+    else:
+        paginator = BoundedCountPaginator(
+            posts,
+            settings.NUMBER_OF_POSTS,
+            count_limit=bounded_count_limit(
+                page_number, settings.NUMBER_OF_POSTS
+            ),
+        )
     return paginator.get_page(page_number)
+
+
+def make_lazy_page(request, posts, **kwargs):
+    """make_page, который выполняется при первом обращении к странице.
+
+    Нужен шаблонам с кешированием фрагментов: при попадании в кеш
+    запросы к базе за постами не делаются вовсе.
+    """
+    return SimpleLazyObject(lambda: make_page(request, posts, **kwargs))
@@ -1,17 +1,39 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
-from django.views.decorators.cache import cache_page
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.views.decorators.http import (
+    etag, require_http_methods, require_POST,
+)
 
-from .models import Group, Post, User
+from core.routers import read_replica
+
+from .cache import (
+    coalesced_cache_page, get_version, replica_safe, versioned_etag,
+)
+from .counters import get_followers_count, get_posts_count
+from .follow import FollowFeedPaginator
+from .models import Comment, Follow, Group, Post, User
+from .search import search_posts
+from .uploads import (
+    UploadError, get_upload, start_upload, upload_status, write_chunk,
+)
 from .forms import CommentForm, PostForm
-from .utils import make_page
+from .utils import (
+    CURSOR_AFTER, CURSOR_BEFORE, KeysetPaginator, make_lazy_page, make_page,
+)
 
 
 # Создание поста под авторизацией
 @login_required
 def post_create(request):
     if request.method == "POST":
-        form = PostForm(request.POST, files=request.FILES or None)
+        form = PostForm(
+            request.POST, files=request.FILES or None, user=request.user
+        )
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
@@ -23,10 +45,48 @@ def post_create(request):
         'posts/create_post.html',
         {
             'form': form,
+            'upload_chunk_size': settings.UPLOAD_CHUNK_SIZE,
         },
     )
 
 
+# Возобновляемая загрузка картинки частями (см. posts.uploads)
+@login_required
+@require_POST
+def upload_create(request):
+    try:
+        upload = start_upload(
+            request.user,
+            request.POST.get('name', ''),
+            int(request.POST.get('size', 0)),
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Неверный размер файла.'}, status=400)
+    except UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PUT'])
+def upload_detail(request, upload_id):
+    upload = get_upload(request.user, upload_id)
+    if upload is None:
+        raise Http404
+    if request.method == 'PUT':
+        # Тело читается потоком, request.body не трогается
+        try:
+            write_chunk(
+                upload, request.META.get('HTTP_CONTENT_RANGE'), request
+            )
+        except UploadError as error:
+            return JsonResponse(
+                {'error': str(error), **upload_status(upload)},
+                status=error.status,
+            )
+    return JsonResponse(upload_status(upload))
+
+
 # Редактирование поста под авторизацией
 @login_required
 def post_edit(request, post_id):
@@ -36,7 +96,8 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post)
+        instance=post,
+        user=request.user)
     if request.method == 'POST':
         if form.is_valid():
             form.save()
@@ -44,12 +105,80 @@ def post_edit(request, post_id):
     return render(
         request,
         'posts/create_post.html',
-        {'form': form, 'is_edit': True},
+        {
+            'form': form,
+            'is_edit': True,
+            'upload_chunk_size': settings.UPLOAD_CHUNK_SIZE,
+        },
     )
 
 
+def _get_once(request, queryset, **lookup):
+    """get_object_or_404, который выполняется один раз на запрос.
+
+    Объект нужен и функции ETag, и самому view; второй раз он
+    берётся из request.
+    """
+    if not hasattr(request, '_page_object'):
+        request._page_object = queryset.filter(**lookup).first()
+    if request._page_object is None:
+        raise Http404
+    return request._page_object
+
+
+def get_group(request, slug):
+    return _get_once(request, Group.objects.all(), slug=slug)
+
+
+def get_author(request, username):
+    return _get_once(
+        request, User.objects.select_related('counter'), username=username
+    )
+
+
+def get_post(request, post_id):
+    return _get_once(
+        request,
+        Post.objects.select_related('author__counter', 'group'),
+        id=post_id,
+    )
+
+
+# ETag страниц строятся из версий их содержимого (см. posts.cache):
+# при совпадении браузер получает 304 без выборки постов и рендеринга.
+def index_etag(request):
+    return versioned_etag(request, ('index_page',))
+
+
+def group_posts_etag(request, slug):
+    return versioned_etag(request, ('group', get_group(request, slug).pk))
+
+
+def profile_etag(request, username):
+    author = get_author(request, username)
+    return versioned_etag(request, ('author', author.pk))
+
+
+def post_detail_etag(request, post_id):
+    post = get_post(request, post_id)
+    # Версия автора - ради числа его постов, группы - ради её названия
+    keys = [('post', post.pk), ('author', post.author_id)]
+    if post.group_id is not None:
+        keys.append(('group', post.group_id))
+    return versioned_etag(request, *keys)
+
+
+def post_list_cache_timeout(version):
+    """Время жизни фрагмента ленты; 0 - не кешировать (см. replica_safe)."""
+    if replica_safe(version):
+        return settings.POST_LIST_CACHE_TIMEOUT
+    return 0
+
+
 # Главная страница
-@cache_page(40, key_prefix='index_page')
+@read_replica
+@etag(index_etag)
+@coalesced_cache_page(settings.INDEX_PAGE_CACHE_TIMEOUT, 'index_page')
 def index(request):
     posts = Post.objects.select_related('group', 'author')
     return render(
@@ -59,38 +188,112 @@ def index(request):
 
 
 # Страница групп
+@read_replica
+@etag(group_posts_etag)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
+    group = get_group(request, slug)
+    version = get_version('group', group.pk)
     posts = group.posts.select_related('author')
     return render(
         request,
         'posts/group_list.html',
-        {'group': group, 'page_obj': make_page(request, posts)},
+        {
+            'group': group,
+            'page_obj': make_lazy_page(
+                request, posts, count=group.posts_count
+            ),
+            'posts_version': version,
+            'cache_timeout': post_list_cache_timeout(version),
+        },
     )
 
 
 # Профайл пользователя
+@read_replica
+@etag(profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_author(request, username)
+    posts_count = get_posts_count(author)
+    version = get_version('author', author.pk)
     posts = Post.objects.select_related('group', 'author').filter(
-        author__username=username
+        author=author
     )
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author=author
+    ).exists()
     return render(
         request,
         'posts/profile.html',
         {
             'author': author,
-            'page_obj': make_page(request, posts),
+            'posts_count': posts_count,
+            'followers_count': get_followers_count(author),
+            'following': following,
+            'page_obj': make_lazy_page(request, posts, count=posts_count),
+            'posts_version': version,
+            'cache_timeout': post_list_cache_timeout(version),
+        },
+    )
+
+
+# Лента постов избранных авторов
+@login_required
+def follow_index(request):
+    paginator = FollowFeedPaginator(request.user, settings.NUMBER_OF_POSTS)
+    return render(
+        request,
+        'posts/follow.html',
+        {
+            'page_obj': paginator.get_page(
+                after=request.GET.get(CURSOR_AFTER),
+                before=request.GET.get(CURSOR_BEFORE),
+            ),
+        },
+    )
+
+
+@login_required
+@require_POST
+def profile_follow(request, username):
+    author = get_object_or_404(User, username=username)
+    if author != request.user:
+        Follow.objects.get_or_create(user=request.user, author=author)
+    return redirect('posts:profile', username=username)
+
+
+@login_required
+@require_POST
+def profile_unfollow(request, username):
+    # delete() по выборке, чтобы сработали сигналы счётчиков и ленты
+    Follow.objects.filter(
+        user=request.user, author__username=username
+    ).delete()
+    return redirect('posts:profile', username=username)
+
+
+# Поиск по текстам постов
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(search_posts(query), settings.NUMBER_OF_POSTS)
+    page_query = request.GET.copy()
+    page_query.pop('page', None)
+    return render(
+        request,
+        'posts/search.html',
+        {
+            'query': query,
+            'page_obj': paginator.get_page(request.GET.get('page')),
+            'page_query': page_query.urlencode(),
         },
     )
 
 
 #Отдельная запись
+@read_replica
+@etag(post_detail_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(
-        Post.objects.select_related('author', 'group'), id=post_id
-        )
-    comments = post.comments.all().select_related('author')
+    post = get_post(request, post_id)
+    comments = comments_page(request, post.comments.all())
     form = CommentForm()
     author = request.user.id
     return render(
@@ -98,10 +301,60 @@ def post_detail(request, post_id):
         'posts/post_detail.html',
         {'post': post,
          'author': author,
+         'posts_count': get_posts_count(post.author),
          'form': form,
          'comments': comments,
         })
 
+
+def comments_page(request, comments):
+    """Порция комментариев после курсора ?after=, от новых к старым."""
+    paginator = KeysetPaginator(
+        comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        date_field='created',
+    )
+    return paginator.get_page(after=request.GET.get(CURSOR_AFTER))
+
+
+# Следующая порция комментариев: HTML-фрагмент или JSON (?format=json)
+def post_comments(request, post_id):
+    get_object_or_404(Post.objects.only('pk'), id=post_id)
+    comments = comments_page(
+        request, Comment.objects.filter(post_id=post_id)
+    )
+    if request.GET.get('format') != 'json':
+        return render(
+            request,
+            'posts/includes/comments.html',
+            {'post_id': post_id, 'comments': comments},
+        )
+    next_url = None
+    if comments.has_next():
+        next_url = '{}?{}={}&format=json'.format(
+            reverse('posts:post_comments', args=(post_id,)),
+            CURSOR_AFTER,
+            comments.next_cursor,
+        )
+    return JsonResponse({
+        'comments': [
+            {
+                'id': comment.pk,
+                'author': comment.author.username,
+                'text': comment.text,
+                'created': comment.created.isoformat(),
+            }
+            for comment in comments
+        ],
+        'html': render_to_string(
+            'posts/includes/comments.html',
+            {'post_id': post_id, 'comments': comments},
+            request,
+        ),
+        'next': next_url,
+    })
+
+
 #Добавление комментариев
 @login_required
 def add_comment(request, post_id):
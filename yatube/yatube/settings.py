@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ViewStatsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,7 +67,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.stats.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -88,11 +90,42 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            # Запись берёт блокировку в начале транзакции и ждёт её
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Псевдонимы реплик из DATABASES, с которых читают представления с
+# core.routers.read_replica. Для проверки на одной машине подойдёт та же
+# база, открытая только на чтение:
+# DATABASES['replica'] = {
+#     'ENGINE': 'core.backends.sqlite3',
+#     'NAME': 'file:' + DATABASES['default']['NAME'] + '?mode=ro',
+#     'OPTIONS': {'uri': True},
+#     'TEST': {'MIRROR': 'default'},
+# }
+# DATABASE_REPLICAS = ['replica']
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Сколько секунд после записи пользователь читает из основной базы
+REPLICA_STICKY_SECONDS: int = 15
+
+# Прагмы для каждого нового соединения с SQLite (core.signals):
+# WAL - читатели не ждут писателя, NORMAL - без fsync на каждый коммит
+# (в WAL это безопасно), busy_timeout - сколько ждать блокировку, мс
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 20000,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -132,6 +165,30 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Картинки постов хранятся по содержимому (core.storage). Файл без ссылок
+# удаляется (сразу или командой gc_media), только если его не сохраняли
+# последние MEDIA_GRACE_PERIOD секунд: на него может ссылаться пост из
+# незафиксированной транзакции.
+MEDIA_GRACE_PERIOD: int = 10 * 60
+
+# Файлы из формы всегда пишутся во временный файл на диске частями,
+# а не собираются в памяти
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Возобновляемые загрузки картинок (posts.uploads). Каталог не должен
+# раздаваться веб-сервером; на одной файловой системе с MEDIA_ROOT
+# готовый файл переносится без копирования.
+UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+UPLOAD_MAX_SIZE: int = 20 * 1024 * 1024
+UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+UPLOAD_EXPIRY: int = 24 * 60 * 60
+# Картинки постов: допустимые форматы и предел числа пикселей проверяются
+# по заголовку; в фоне оригинал пересохраняется без метаданных и
+# уменьшается до POST_IMAGE_MAX_SIZE по длинной стороне
+POST_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+POST_IMAGE_MAX_PIXELS: int = 50 * 1000 * 1000
+POST_IMAGE_MAX_SIZE: int = 2560
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'users:logout'
@@ -139,6 +196,15 @@ CSRF_FAILURE_VIEW = 'core.views.page_not_found'
 PAGE_NOT_FOUND_VIEW = 'core.views.csrf_failure'
 NUMBER_OF_POSTS: int = 10
 NUMBER_OF_POSTS_PAGE_TWO: int = 3
+# Комментариев на странице поста и в одной подгружаемой порции
+COMMENTS_PER_PAGE: int = 20
+# До скольких объектов BoundedCountPaginator считает точно
+PAGINATOR_COUNT_LIMIT: int = 10000
+# Записей в RSS/Atom/JSON-фиде по умолчанию и максимум для ?limit=
+FEED_ITEMS: int = 50
+FEED_MAX_ITEMS: int = 500
+# Курсорная пагинация (дата, id) вместо номеров страниц
+KEYSET_PAGINATION: bool = False
 POST_CREATE: int = 5
 POST_EDIT: int = 6
 POST_DETAIL: int = 3
@@ -146,8 +212,101 @@ POST_COMMENT: int = 7
 POST_URL: int = 0
 SLICE_LETTERS: int = 15
 
+# Миниатюры картинок постов: имя -> (геометрия, опции sorl-thumbnail).
+# Строятся фоновой задачей при сохранении картинки. feed - JPEG для
+# браузеров без srcset, остальные - варианты для srcset.
+POST_THUMBNAILS = {
+    'feed': ('960x339', {
+        'crop': 'center', 'upscale': True, 'format': 'JPEG', 'quality': 80,
+    }),
+    'feed_480': ('480x170', {
+        'crop': 'center', 'upscale': True, 'format': 'JPEG', 'quality': 80,
+    }),
+    'feed_1440': ('1440x508', {
+        'crop': 'center', 'upscale': True, 'format': 'JPEG', 'quality': 80,
+    }),
+    'feed_480_webp': ('480x170', {
+        'crop': 'center', 'upscale': True, 'format': 'WEBP', 'quality': 80,
+    }),
+    'feed_960_webp': ('960x339', {
+        'crop': 'center', 'upscale': True, 'format': 'WEBP', 'quality': 80,
+    }),
+    'feed_1440_webp': ('1440x508', {
+        'crop': 'center', 'upscale': True, 'format': 'WEBP', 'quality': 80,
+    }),
+}
+# Варианты srcset для миниатюры: тип -> миниатюры по возрастанию ширины.
+# Браузер выбирает WebP нужной ширины, остальные получают JPEG.
+POST_THUMBNAIL_SRCSET = {
+    'feed': {
+        'image/webp': ('feed_480_webp', 'feed_960_webp', 'feed_1440_webp'),
+        'image/jpeg': ('feed_480', 'feed', 'feed_1440'),
+    },
+}
+# Сколько секунд не повторять построение миниатюр после неудачи
+POST_THUMBNAILS_RETRY_TIMEOUT: int = 60 * 60
+# Фоновые задачи выполняются в потоке процесса; True - выполнять сразу
+BACKGROUND_TASKS_SYNC: bool = False
+
+# Лента подписок: посты авторов, у которых подписчиков больше предела,
+# не раскладываются по лентам, а подмешиваются при чтении
+FOLLOW_FANOUT_LIMIT: int = 10000
+# Сколько последних постов автора попадает в ленту при подписке
+FOLLOW_BACKFILL_POSTS: int = 100
+
+# Предельное число SQL-запросов на представление, сверх - предупреждение
+VIEW_QUERY_BUDGETS = {
+    'posts:index': 6,
+    'posts:group_list': 6,
+    'posts:profile': 6,
+    'posts:follow_index': 6,
+    'posts:post_detail': 6,
+    'posts:post_create': 10,
+    'posts:post_edit': 12,
+    'posts:add_comment': 10,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # INFO - строка с замерами на каждый запрос
+        'core.stats': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
+# Двухуровневый кеш (core.cache.TieredCache): LRU в памяти процесса
+# на несколько секунд перед общим для всех воркеров файловым кешем.
+# Версии содержимого (posts.cache) читаются только из общего уровня.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': 5,
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_EXCLUDE': ('posts_version', 'posts_lock'),
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
+# Главная сбрасывается сигналами при изменении постов, поэтому живёт долго
+INDEX_PAGE_CACHE_TIMEOUT: int = 60 * 60
+# Фрагменты лент групп и авторов, сбрасываются так же по версиям
+POST_LIST_CACHE_TIMEOUT: int = 60 * 60
+# Сколько истёкшая страница отдаётся, пока один запрос её обновляет
+PAGE_CACHE_STALE_TIMEOUT: int = 60
+# Предельное время перерисовки страницы под блокировкой
+CACHE_LOCK_TIMEOUT: int = 10
@@ -0,0 +1,14 @@
+"""Настройки для тестов (manage.py test и pytest)."""
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+# Тесты не должны видеть кеш прошлых прогонов на другой базе и чистить
+# общий кеш на диске
+CACHES['shared'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+}
+
+# Фоновые задачи выполняются сразу: поток с задачей иначе ходит в ту же
+# базу параллельно с тестом
+BACKGROUND_TASKS_SYNC = True